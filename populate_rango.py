@@ -4,7 +4,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE',
 
 import django 
 django.setup()
-from rango.models import Category, Page
+from rango.models import Page
+from rango.bulk_loader import BulkLoader
 
 def populate():
 # First, we will create lists of dictionaries containing the pages
@@ -56,31 +57,19 @@ def populate():
     # If you want to add more categories or pages,
     # add them to the dictionaries above.
     
-    # The code below goes through the cats dictionary, then adds each category,
-    # and then adds all the associated pages for that category.
-    for cat, cat_data in cats.items():
-        c = add_cat(cat, cat_data["views"], cat_data["likes"])
-        for p in cat_data['pages']:
-            add_page(c, p['title'], p['url'], p["views"])
+    # The code below turns the cats dictionary into a stream of category and
+    # page records, which the bulk loader writes in a few batched queries.
+    BulkLoader().load(records(cats))
     
     # Print out the categories we have added.
-    for c in Category.objects.all():
-        for p in Page.objects.filter(category=c):
-            print(f'- {c}: {p}')
-
-def add_page(cat, title, url, views=0):
-    p = Page.objects.get_or_create(category=cat, title=title)[0]
-    p.url = url
-    p.views = views
-    p.save()
-    return p
+    for p in Page.objects.select_related("category").order_by("category_id", "id"):
+        print(f'- {p.category}: {p}')
 
-def add_cat(name, views=0, likes=0):
-    c = Category.objects.get_or_create(name=name)[0]
-    c.views = views
-    c.likes = likes
-    c.save()
-    return c
+def records(cats):
+    for cat, cat_data in cats.items():
+        yield {"category": cat, "views": cat_data["views"], "likes": cat_data["likes"]}
+        for p in cat_data['pages']:
+            yield {"category": cat, "title": p['title'], "url": p['url'], "views": p["views"]}
 
 # Start execution here!
 if __name__ == '__main__':
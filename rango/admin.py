@@ -1,11 +1,12 @@
 from django.contrib import admin
-from rango.models import Category, Page, UserProfile
+from rango.models import Category, CategoryLike, Page, UserProfile
 
 class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug":("name", )}
 
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(UserProfile)
+admin.site.register(CategoryLike)
 
 class PageAdmin(admin.ModelAdmin):
     list_display = ("title", "category", "url")
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RangoConfig(AppConfig):
     name = 'rango'
+    
+    def ready(self):
+        # Connect the cache invalidation signal handlers.
+        import rango.signals
@@ -0,0 +1,90 @@
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from django.conf import settings
+from django.http import parse_cookie
+from django.middleware.csrf import _compare_salted_tokens, _sanitize_token
+from django.urls import Resolver404, resolve
+
+from rango.bing_search import SEARCH_RESULTS_KEY, arun_query
+
+
+# Views whose POSTed "query" is searched before the view runs.
+SEARCH_VIEWS = {"rango:search", "rango:show_category"}
+
+# Larger bodies aren't search forms.
+MAX_SEARCH_BODY = 64 * 1024
+
+
+class RangoASGIHandler:
+    """
+    Serves the project over ASGI on Django 2.2, which has no ASGI handler of
+    its own.
+
+    Unlike asgiref's WsgiToAsgi, which runs every request on one shared
+    thread, each request runs in the event loop's thread pool, as under a
+    threaded WSGI server. Searches are the slow requests: for a search form
+    POSTed to one of SEARCH_VIEWS, the query is run first with arun_query,
+    which waits on the network in the event loop, and the view picks up the
+    results through search_results() instead of blocking its thread.
+    Middleware, CSRF checks included, still runs as usual before the view;
+    so that a forged POST can't spend a search either, the query is only
+    run early if the form's CSRF token matches the cookie.
+    """
+
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+
+    async def __call__(self, scope, receive, send):
+        await RangoASGIInstance(self.wsgi_application)(scope, receive, send)
+
+
+class RangoASGIInstance(WsgiToAsgiInstance):
+    search = None
+
+    async def run_wsgi_app(self, body):
+        query = self.search_query(body)
+        if query:
+            self.search = (query, await arun_query(query))
+        run = sync_to_async(WsgiToAsgiInstance.run_wsgi_app.__wrapped__, thread_sensitive=False)
+        await run(self, body)
+
+    def search_query(self, body):
+        if self.scope["method"] != "POST":
+            return None
+        try:
+            match = resolve(self.scope["path"])
+        except Resolver404:
+            return None
+        if match.view_name not in SEARCH_VIEWS:
+            return None
+        data = body.read(MAX_SEARCH_BODY + 1)
+        body.seek(0)
+        if len(data) > MAX_SEARCH_BODY:
+            return None
+        form = parse_qs(data.decode("utf-8", "replace"))
+        if not self.csrf_token_matches(form):
+            return None
+        values = form.get("query")
+        return values[0].strip() if values else None
+
+    def csrf_token_matches(self, form):
+        # The same comparison CsrfViewMiddleware makes. With the token kept
+        # in the session there's nothing to compare with yet, so the view
+        # runs the search itself.
+        if settings.CSRF_USE_SESSIONS:
+            return False
+        header = "; ".join(value.decode("latin-1") for name, value in self.scope.get("headers", [])
+                           if name.lower() == b"cookie")
+        cookie = parse_cookie(header).get(settings.CSRF_COOKIE_NAME)
+        token = form.get("csrfmiddlewaretoken", [""])[0]
+        if not cookie or not token:
+            return False
+        return _compare_salted_tokens(_sanitize_token(token), _sanitize_token(cookie))
+
+    def build_environ(self, scope, body):
+        environ = super().build_environ(scope, body)
+        if self.search is not None:
+            environ[SEARCH_RESULTS_KEY] = self.search
+        return environ
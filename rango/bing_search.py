@@ -1,15 +1,38 @@
+import asyncio
+import hashlib
 import json
 import requests
 import sys
+import threading
+import time
 import pprint
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rango.caching import TTLLRUCache
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+BING_SEARCH_URL = "https://api.cognitive.microsoft.com/bing/v7.0/search"
 
 # Microsoft account key in bing.key
 def read_bing_key():
-    """ 
+    """
     reads the BING API key from a file called 'bing.key'
     returns a string which is either None, i.e. key not found, or with a key
     """
-    bing_api_key = None
+    bing_api_key = getattr(settings, "BING_API_KEY", None)
+    if bing_api_key:
+        return bing_api_key
+
     try:
         with open("bing.key", "r") as f:
             bing_api_key = f.readline().strip()
@@ -19,36 +42,411 @@ def read_bing_key():
                 bing_api_key = f.readline().strip()
         except:
             raise IOError("bing.ket file not found")
-            
+
     if not bing_api_key:
         raise KeyError("Bing key not found")
-        
+
     return bing_api_key
 
 
-def run_query(search_terms):
-    bing_key = read_bing_key()
-    search_url = "https://api.cognitive.microsoft.com/bing/v7.0/search"
-    headers = {"Ocp-Apim-Subscription-Key": bing_key}
-    params = {"q": search_terms, "textDecorations": True, "textFormat": "HTML"}
-    
-    # Issue the request, given the details above
-    try:
-        response = requests.get(search_url, headers = headers, params = params)
-        response.raise_for_status()
-        search_results = response.json()
-    except:
-        print("Connection error")
-    
+class SearchResultCache:
+    """
+    Caches search results by normalized query terms, so "Django  Forms" and
+    "django forms" share an entry. Results are kept in a per-process TTL/LRU
+    cache and, if RANGO_SEARCH_CACHE_ALIAS names one of the CACHES, also in
+    that shared backend so every worker can reuse them.
+    """
+
+    def __init__(self):
+        self._local = None
+        self.shared_hits = 0
+
+    @property
+    def local(self):
+        # Created on first use, so importing this module doesn't need settings.
+        if self._local is None:
+            self._local = TTLLRUCache(max_size=getattr(settings, "RANGO_SEARCH_CACHE_SIZE", 1024),
+                                      ttl=getattr(settings, "RANGO_SEARCH_CACHE_TTL", 600))
+        return self._local
+
+    @staticmethod
+    def normalize(search_terms):
+        return " ".join(search_terms.lower().split())
+
+    @staticmethod
+    def shared_backend():
+        alias = getattr(settings, "RANGO_SEARCH_CACHE_ALIAS", None)
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def shared_key(normalized):
+        # Hash the terms so the key is safe for memcached.
+        return "rango:search:" + hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    def get(self, search_terms):
+        normalized = self.normalize(search_terms)
+        results = self.local.get(normalized)
+        if results is None:
+            backend = self.shared_backend()
+            if backend is not None:
+                results = backend.get(self.shared_key(normalized))
+                if results is not None:
+                    self.shared_hits += 1
+                    self.local.set(normalized, results)
+        return results
+
+    def set(self, search_terms, results):
+        normalized = self.normalize(search_terms)
+        self.local.set(normalized, results)
+        backend = self.shared_backend()
+        if backend is not None:
+            backend.set(self.shared_key(normalized), results, self.local.ttl)
+
+    def clear(self):
+        self.local.clear()
+        self.shared_hits = 0
+
+    def stats(self):
+        stats = self.local.stats()
+        # A shared hit is also counted as a local miss.
+        stats["shared_hits"] = self.shared_hits
+        stats["misses"] -= self.shared_hits
+        stats["hits"] += self.shared_hits
+        return stats
+
+
+search_cache = SearchResultCache()
+
+
+def parse_results(search_results):
     # With the reponse in plat, build up a python list
     results = []
-    for result in search_results["webPages"]["value"]:
+    for result in search_results.get("webPages", {}).get("value", []):
         results.append({
                 "title": result["name"],
                 "link": result["url"],
                 "summary": result["snippet"]})
     return results
 
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures. Once failure_threshold is reached the
+    circuit opens and calls are refused for reset_timeout seconds; after that
+    a single trial call is let through while the others are still refused.
+    Its success closes the circuit and its failure opens it again. A trial
+    that never reports back is given up on after another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def allow(self):
+        """Whether a call may go ahead. While half-open, True starts the trial."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = self._clock()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+                return False
+            self.trial_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_started_at = None
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self._clock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            now = self._clock()
+            return (now - self.opened_at < self.reset_timeout or
+                    self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout)
+
+
+class BingSearchClient:
+    """
+    A long-lived client for the Bing search API. The API key is read once,
+    connections are pooled and kept alive by a requests Session, every call
+    is bounded by connect and read timeouts, failed calls are retried with
+    exponential backoff and a circuit breaker stops calling an unhealthy
+    upstream altogether for a while.
+    """
+
+    def __init__(self, search_url=None, api_key=None, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_factor=0.3, pool_size=10,
+                 failure_threshold=5, reset_timeout=30):
+        self.search_url = search_url or BING_SEARCH_URL
+        self._api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                      status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(search_url=getattr(settings, "BING_SEARCH_URL", BING_SEARCH_URL),
+                   connect_timeout=getattr(settings, "BING_CONNECT_TIMEOUT", 3.05),
+                   read_timeout=getattr(settings, "BING_READ_TIMEOUT", 10),
+                   max_retries=getattr(settings, "BING_MAX_RETRIES", 2),
+                   backoff_factor=getattr(settings, "BING_RETRY_BACKOFF", 0.3),
+                   pool_size=getattr(settings, "BING_POOL_SIZE", 10),
+                   failure_threshold=getattr(settings, "BING_CIRCUIT_FAILURES", 5),
+                   reset_timeout=getattr(settings, "BING_CIRCUIT_RESET", 30))
+
+    @property
+    def api_key(self):
+        if self._api_key is None:
+            self._api_key = read_bing_key()
+        return self._api_key
+
+    def search(self, search_terms):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Bing search is unavailable")
+
+        headers = {"Ocp-Apim-Subscription-Key": self.api_key}
+        params = {"q": search_terms, "textDecorations": True, "textFormat": "HTML"}
+
+        # Issue the request, given the details above
+        try:
+            response = self.session.get(self.search_url, headers = headers,
+                                        params = params, timeout = self.timeout)
+            response.raise_for_status()
+            search_results = response.json()
+        except (requests.RequestException, ValueError):
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return parse_results(search_results)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncBingSearchClient:
+    """
+    The asyncio counterpart of BingSearchClient, built on httpx. One event
+    loop can keep many searches in flight on a shared connection pool, with
+    the same timeouts, retries with backoff and circuit breaker.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, search_url=None, api_key=None, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_factor=0.3, pool_size=100,
+                 failure_threshold=5, reset_timeout=30):
+        if httpx is None:
+            raise ImproperlyConfigured("AsyncBingSearchClient needs httpx to be installed.")
+        self.search_url = search_url or BING_SEARCH_URL
+        self._api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+
+    @classmethod
+    def from_settings(cls):
+        return cls(search_url=getattr(settings, "BING_SEARCH_URL", BING_SEARCH_URL),
+                   connect_timeout=getattr(settings, "BING_CONNECT_TIMEOUT", 3.05),
+                   read_timeout=getattr(settings, "BING_READ_TIMEOUT", 10),
+                   max_retries=getattr(settings, "BING_MAX_RETRIES", 2),
+                   backoff_factor=getattr(settings, "BING_RETRY_BACKOFF", 0.3),
+                   pool_size=getattr(settings, "BING_ASYNC_POOL_SIZE", 100),
+                   failure_threshold=getattr(settings, "BING_CIRCUIT_FAILURES", 5),
+                   reset_timeout=getattr(settings, "BING_CIRCUIT_RESET", 30))
+
+    @property
+    def api_key(self):
+        if self._api_key is None:
+            self._api_key = read_bing_key()
+        return self._api_key
+
+    async def _get(self, headers, params):
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self.client.get(self.search_url, headers=headers, params=params)
+            except httpx.TransportError:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES or last_attempt:
+                    return response
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def search(self, search_terms):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Bing search is unavailable")
+
+        headers = {"Ocp-Apim-Subscription-Key": self.api_key}
+        params = {"q": search_terms, "textDecorations": "true", "textFormat": "HTML"}
+        try:
+            response = await self._get(headers, params)
+            response.raise_for_status()
+            search_results = response.json()
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            # Report it like the synchronous client does.
+            raise IOError(str(e)) from e
+        except ValueError:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return parse_results(search_results)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+_search_client = None
+_async_search_client = None
+_search_client_lock = threading.Lock()
+
+
+def get_search_client():
+    global _search_client
+    if _search_client is None:
+        with _search_client_lock:
+            if _search_client is None:
+                _search_client = BingSearchClient.from_settings()
+    return _search_client
+
+
+def get_async_search_client():
+    # The httpx client belongs to the event loop it is first used on, which
+    # under ASGI is the one loop the worker runs for its whole life.
+    global _async_search_client
+    if _async_search_client is None:
+        _async_search_client = AsyncBingSearchClient.from_settings()
+    return _async_search_client
+
+
+@receiver(setting_changed)
+def reset_search_client(setting=None, **kwargs):
+    global _search_client, _async_search_client
+    if setting is None or setting.startswith("BING_"):
+        with _search_client_lock:
+            if _search_client is not None:
+                _search_client.close()
+            _search_client = None
+            _async_search_client = None
+
+
+def fetch_results(search_terms):
+    return get_search_client().search(search_terms)
+
+
+_search_backend = None
+
+
+def get_search_backend():
+    """Returns the backend named by the RANGO_SEARCH_BACKEND setting."""
+    global _search_backend
+    if _search_backend is None:
+        with _search_client_lock:
+            if _search_backend is None:
+                path = getattr(settings, "RANGO_SEARCH_BACKEND", "rango.search_backends.BingSearchBackend")
+                _search_backend = import_string(path)()
+    return _search_backend
+
+
+@receiver(setting_changed)
+def reset_search_backend(setting=None, **kwargs):
+    global _search_backend
+    if setting is None or setting == "RANGO_SEARCH_BACKEND":
+        _search_backend = None
+
+
+# Under ASGI, rango.asgi runs searches on the event loop before the view and
+# passes them on in the WSGI environ under this key, as (query, results).
+SEARCH_RESULTS_KEY = "rango.search_results"
+
+
+def search_results(request, query):
+    """
+    The results for query: the ones fetched on the event loop for this
+    request if there are any, else run_query's.
+    """
+    prefetched = request.META.get(SEARCH_RESULTS_KEY)
+    if prefetched is not None and prefetched[0] == query:
+        return prefetched[1]
+    return run_query(query)
+
+
+def run_query(search_terms):
+    backend = get_search_backend()
+    if backend.cacheable:
+        results = search_cache.get(search_terms)
+        if results is not None:
+            return results
+
+    try:
+        results = backend.search(search_terms)
+    except CircuitOpenError:
+        return []
+    except (OSError, ValueError, KeyError):
+        # Failures are not cached, so the next search tries again.
+        print("Connection error")
+        return []
+
+    if backend.cacheable:
+        search_cache.set(search_terms, results)
+    return results
+
+async def arun_query(search_terms):
+    """
+    The asyncio version of run_query, for async views. It shares the result
+    cache, and waits on the network without holding a thread where the
+    backend supports it.
+    """
+    backend = get_search_backend()
+    if backend.cacheable:
+        results = search_cache.get(search_terms)
+        if results is not None:
+            return results
+
+    try:
+        results = await backend.asearch(search_terms)
+    except CircuitOpenError:
+        return []
+    except (OSError, ValueError, KeyError):
+        print("Connection error")
+        return []
+
+    if backend.cacheable:
+        search_cache.set(search_terms, results)
+    return results
+
 def main():
     search_term = input("Search (type q to exit): ").strip()
     while search_term!="q":
@@ -56,7 +454,12 @@ def main():
         pprint.pprint(results)
         search_term = input("Search (type q to exit): ").strip()
     sys.exit()
-    
-    
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Run with python -m rango.bing_search, so the settings can be loaded.
+    import os
+    import django
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tango_with_django_project.settings")
+    django.setup()
+    main()
@@ -0,0 +1,194 @@
+import csv
+import json
+import random
+from itertools import accumulate, islice
+
+from django.db import transaction
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+
+from rango import page_cache
+from rango.caching import bump_version
+from rango.category_cache import category_slugs
+from rango.models import Category, Page
+from rango.suggestions import category_index
+
+
+# Records are dictionaries. A category record has "category" and optionally
+# "views" and "likes"; a page record also has "title", "url" and "views".
+#
+#   {"category": "Python", "views": 128, "likes": 64}
+#   {"category": "Python", "title": "Official Python Tutorial", "url": "http://docs.python.org/3/tutorial/", "views": 11}
+#
+# CSV files use the same names as columns; rows without a title are categories.
+
+CSV_FIELDS = ["category", "title", "url", "views", "likes"]
+
+
+def read_records(path):
+    """Streams records from a .jsonl or .csv file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if value not in (None, "")}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_records(records, path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+
+def generate_records(categories, pages, seed=None, exponent=1.1, max_views=100000, max_likes=10000):
+    """
+    Generates categories and pages with Zipf-like popularity: a few categories
+    hold most of the pages, and a few pages and categories get most of the
+    views and likes, as in real traffic.
+    """
+    rng = random.Random(seed)
+    alpha = 1 / exponent
+
+    def popularity(maximum):
+        # Pareto-distributed, the continuous form of Zipf's law.
+        return min(int(rng.paretovariate(alpha)) - 1, maximum)
+
+    names = [f"Category {i:0{len(str(categories))}d}" for i in range(categories)]
+    for name in names:
+        yield {"category": name, "views": popularity(max_views), "likes": popularity(max_likes)}
+
+    # The i-th category gets pages in proportion to 1 / (i + 1) ** exponent.
+    weights = list(accumulate(1 / (rank + 1) ** exponent for rank in range(categories)))
+    width = len(str(pages))
+    for i in range(pages):
+        name = rng.choices(names, cum_weights=weights)[0]
+        yield {"category": name, "title": f"Page {i:0{width}d}",
+               "url": f"http://www.example.com/pages/{i}/", "views": popularity(max_views)}
+
+
+class BulkLoader:
+    """
+    Loads category and page records in batches. Each batch is written with a
+    handful of bulk_create/bulk_update statements inside one transaction,
+    instead of two or three queries per row.
+
+    With upsert (the default), existing categories are matched by name and
+    existing pages by (category, title) and updated in place. Turn it off when
+    loading into an empty database to skip those lookups.
+    """
+
+    def __init__(self, batch_size=5000, upsert=True):
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.category_ids = {}
+        self.created = {"categories": 0, "pages": 0}
+        self.updated = {"categories": 0, "pages": 0}
+        # Slugs of the categories whose row or pages were written.
+        self.touched = set()
+
+    def load(self, records):
+        if self.upsert:
+            self.category_ids = dict(Category.objects.values_list("name", "id"))
+
+        records = iter(records)
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                self._load_batch(batch)
+
+        # bulk_create and bulk_update don't send the signals that invalidate
+        # the caches, so invalidate everything the load may have changed.
+        bump_version("categories")
+        page_cache.invalidate_rankings()
+        page_cache.invalidate_categories(self.touched)
+        category_index.invalidate()
+        category_slugs.clear()
+        return self
+
+    def _load_batch(self, batch):
+        categories = {}
+        pages = []
+        for record in batch:
+            name = record["category"]
+            if "title" in record:
+                categories.setdefault(name, {})
+                pages.append(record)
+            else:
+                categories[name] = record
+
+        self._load_categories(categories)
+        if pages:
+            self._load_pages(pages)
+
+    def _load_categories(self, records):
+        new = [Category(name=name, slug=slugify(name), views=int(record.get("views", 0)),
+                        likes=int(record.get("likes", 0)))
+               for name, record in records.items() if name not in self.category_ids]
+        # Only the counts a record has are written; a file without a likes
+        # column leaves the likes alone.
+        existing = {}
+        for name, record in records.items():
+            fields = tuple(field for field in ("views", "likes") if field in record)
+            if name in self.category_ids and fields:
+                existing.setdefault(fields, []).append(
+                    Category(id=self.category_ids[name], name=name, slug=slugify(name),
+                             **{field: int(record[field]) for field in fields}))
+
+        self.touched.update(category.slug for category in new)
+        if new:
+            Category.objects.bulk_create(new)
+            self.created["categories"] += len(new)
+            # Not every database returns the new primary keys from bulk_create.
+            self.category_ids.update(Category.objects.filter(name__in=[category.name for category in new])
+                                     .values_list("name", "id"))
+        for fields, categories in existing.items():
+            self.touched.update(category.slug for category in categories)
+            # bulk_update doesn't apply auto_now.
+            for category in categories:
+                category.updated_at = timezone.now()
+            Category.objects.bulk_update(categories, list(fields) + ["updated_at"])
+            self.updated["categories"] += len(categories)
+
+    def _load_pages(self, records):
+        existing_ids = {}
+        if self.upsert:
+            existing_ids = {(category_id, title): page_id for page_id, category_id, title in
+                            Page.objects.filter(category_id__in={self.category_ids[r["category"]] for r in records},
+                                                title__in={r["title"] for r in records})
+                            .values_list("id", "category_id", "title")}
+
+        # A page listed twice in the batch is written once, with its last values.
+        pages = {}
+        for record in records:
+            key = (self.category_ids[record["category"]], record["title"])
+            pages[key] = (Page(id=existing_ids.get(key), category_id=key[0], title=key[1],
+                               url=record["url"], views=int(record.get("views", 0))),
+                          ("url", "views") if "views" in record else ("url",))
+
+        self.touched.update(slugify(record["category"]) for record in records)
+        new = [page for page, fields in pages.values() if page.id is None]
+        existing = {}
+        for page, fields in pages.values():
+            if page.id is not None:
+                existing.setdefault(fields, []).append(page)
+        if new:
+            Page.objects.bulk_create(new)
+            self.created["pages"] += len(new)
+        for fields, existing_pages in existing.items():
+            for page in existing_pages:
+                page.updated_at = timezone.now()
+            Page.objects.bulk_update(existing_pages, list(fields) + ["updated_at"])
+            self.updated["pages"] += len(existing_pages)
+        # The categories of the pages count as modified too.
+        Category.objects.filter(id__in={category_id for category_id, title in pages}).update(
+            updated_at=timezone.now())
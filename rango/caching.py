@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import Warning, register
+
+
+# Cached data is stored under keys that include a version number. Changing
+# the underlying rows bumps the version, which orphans every entry built from
+# the old data in one cheap operation; the orphans simply expire.
+#
+# That only reaches every worker if the versions live in a cache they all
+# share. With a per-process cache, a bump is only seen by the worker that
+# made it, so entries are kept for at most RANGO_LOCAL_CACHE_TIMEOUT seconds
+# and the other workers catch up within that time.
+
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def cache_is_shared():
+    return settings.CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
+
+
+def cache_timeout(timeout):
+    """timeout, capped when the default cache isn't shared between workers."""
+    if cache_is_shared():
+        return timeout
+    return min(timeout, getattr(settings, "RANGO_LOCAL_CACHE_TIMEOUT", 5))
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [Warning(
+        "The default cache is local to each process, so cached pages and lists are only "
+        "refreshed every RANGO_LOCAL_CACHE_TIMEOUT seconds in workers other than the one "
+        "that changed the data.",
+        hint="Configure a cache shared by all workers, such as memcached, as CACHES['default'].",
+        id="rango.W001",
+    )]
+
+def _version_key(name):
+    return f"rango:version:{name}"
+
+
+def get_version(name):
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so a version key that was
+        # evicted never comes back at a number that is still in use.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(*names):
+    """Like get_version() for several names, in one round trip to the cache."""
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    return tuple(found[key] if key in found else get_version(name) for name, key in zip(names, keys))
+
+
+def bump_version(name):
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        return get_version(name)
+
+
+def versioned_key(name, *parts):
+    return ":".join(["rango", name, str(get_version(name))] + [str(part) for part in parts])
+
+
+class TTLLRUCache:
+    """
+    A bounded in-process cache. Entries expire ttl seconds after they were
+    stored and, once max_size entries are held, the least recently used
+    entry is evicted. Hits and misses are counted for monitoring.
+    """
+
+    def __init__(self, max_size=1024, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: while one thread computes
+    the value, other threads asking for that key wait and share its result
+    (or its exception) instead of computing it again.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class WorkerSnapshots:
+    """
+    Lets every worker process publish a snapshot of its own state to the
+    cache and read back everyone's. Each worker holds a numbered slot, which
+    it claims with cache.add, so concurrent workers never overwrite each
+    other. A worker that stops publishing has its snapshot expire after the
+    timeout given to publish(), and its slot is then reused by a new worker.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._pid = None
+        self._token = None
+        self._slot = None
+
+    def _slot_key(self, slot):
+        return f"rango:{self.name}:slot:{slot}"
+
+    def _slots(self):
+        return cache.get(f"rango:{self.name}:slots") or 0
+
+    def publish(self, snapshot, timeout):
+        # A forked worker is a new worker.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex
+            self._slot = None
+        value = (self._token, snapshot)
+        if self._slot is not None:
+            current = cache.get(self._slot_key(self._slot))
+            if current is not None and current[0] == self._token:
+                cache.set(self._slot_key(self._slot), value, timeout)
+                return
+            # The slot expired and may have been claimed by another worker.
+        self._slot = self._claim(value, timeout)
+
+    def _claim(self, value, timeout):
+        for slot in range(1, self._slots() + 1):
+            if cache.add(self._slot_key(slot), value, timeout):
+                return slot
+        count_key = f"rango:{self.name}:slots"
+        while True:
+            cache.add(count_key, 0, timeout=None)
+            try:
+                slot = cache.incr(count_key)
+            except ValueError:
+                continue
+            if cache.add(self._slot_key(slot), value, timeout):
+                return slot
+
+    def collect(self, include_self=True):
+        """The snapshots published by the live workers."""
+        keys = [self._slot_key(slot) for slot in range(1, self._slots() + 1)]
+        return [snapshot for token, snapshot in cache.get_many(keys).values()
+                if include_self or token != self._token]
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from rango.caching import TTLLRUCache, cache_timeout, get_versions
+from rango.models import Category
+
+
+class CategorySlugCache:
+    """
+    Per-process cache of slug -> category, for the views that start by
+    looking a category up by the slug in their URL. Unknown slugs are cached
+    too, so crawlers requesting made-up URLs don't cost a query each.
+
+    Entries remember the cache versions current when they were read: the
+    "categories" version (bumped when any category is created, renamed or
+    deleted) and the category's own "category:<slug>" version (bumped when
+    its likes or pages change). An entry is only used while both still
+    match. With a shared default cache, other processes' changes are seen
+    straight away; with a per-process one, entries are kept for at most
+    RANGO_LOCAL_CACHE_TIMEOUT seconds instead.
+
+    updated_at is kept too, so the conditional GET validators can be built
+    without a query.
+    """
+
+    FIELDS = ("id", "name", "slug", "views", "likes", "updated_at")
+
+    def __init__(self):
+        self._cache = None
+
+    @property
+    def cache(self):
+        # Created on first use, so importing this module doesn't need settings.
+        if self._cache is None:
+            self._cache = TTLLRUCache(max_size=getattr(settings, "RANGO_SLUG_CACHE_SIZE", 10000),
+                                      ttl=cache_timeout(getattr(settings, "RANGO_SLUG_CACHE_TTL", 60)))
+        return self._cache
+
+    def get(self, slug):
+        """Returns the Category with this slug, or None if there isn't one."""
+        # Both versions in one round trip, and before the row is read, so a
+        # change made in between leaves the entry outdated rather than
+        # wrongly current.
+        categories_version, category_version = get_versions("categories", "category:" + slug)
+        entry = self.cache.get(slug)
+        if entry is not None:
+            versions, row = entry
+            if row is None:
+                if versions == (categories_version,):
+                    return None
+            elif versions == (categories_version, category_version):
+                return Category(**dict(zip(self.FIELDS, row)))
+
+        # From the primary: the entry is stored under the current versions,
+        # which a lagging replica may not have caught up with.
+        row = Category.objects.using(DEFAULT_DB_ALIAS).filter(slug=slug).values_list(*self.FIELDS).first()
+        if row is None:
+            # Kept briefly: with a per-process cache, this worker doesn't
+            # see the version bump when another one creates the category.
+            self.cache.set(slug, ((categories_version,), None),
+                           ttl=cache_timeout(getattr(settings, "RANGO_SLUG_CACHE_NEGATIVE_TTL", 10)))
+            return None
+        self.cache.set(slug, ((categories_version, category_version), row))
+        return Category(**dict(zip(self.FIELDS, row)))
+
+    def clear(self):
+        self.cache.clear()
+
+
+category_slugs = CategorySlugCache()
@@ -0,0 +1,59 @@
+import hashlib
+
+from rango import db_router
+from rango.caching import get_version
+from rango.category_cache import category_slugs
+
+
+# Validators for django.views.decorators.http.condition(). They are built
+# from Category.updated_at, which also moves when one of the category's pages
+# changes, read through the slug cache, so a repeat request (for an unknown
+# slug too) is usually answered without a query instead of rendering the page.
+#
+# The slug cache is filled from the primary, so a request with these
+# validators is pinned to the primary too: a body read from a lagging replica
+# would be stored by the browser under the ETag of newer data, and then
+# revalidated with a 304 until the category changes again.
+
+def make_etag(*parts):
+    return hashlib.sha1(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def _category_state(request, slug):
+    # condition() calls both validator functions; look the category up once.
+    memo = request.__dict__.setdefault("_rango_category_state", {})
+    if slug not in memo:
+        db_router.pin_to_primary()
+        category = category_slugs.get(slug)
+        memo[slug] = (category.id, category.updated_at) if category is not None else None
+    return memo[slug]
+
+
+def _viewer(request):
+    # Logged-in users see a like button and a search form on category pages.
+    return request.user.pk if request.user.is_authenticated else "anonymous"
+
+
+def category_etag(request, category_name_slug):
+    state = _category_state(request, category_name_slug)
+    if state is None:
+        return None
+    # The sidebar lists every category, so its version is part of the page too.
+    return make_etag("category", category_name_slug, state[1].isoformat(),
+                     get_version("categories"), _viewer(request))
+
+
+def category_last_modified(request, category_name_slug):
+    # The ETag covers the sidebar and the viewer; a date alone can't, so only
+    # anonymous visitors get one.
+    if request.user.is_authenticated:
+        return None
+    state = _category_state(request, category_name_slug)
+    return state[1] if state else None
+
+
+def page_listing_etag(request, category_name_slug):
+    state = _category_state(request, category_name_slug)
+    if state is None:
+        return None
+    return make_etag("page_listing", category_name_slug, request.GET.get("cursor", ""), state[1].isoformat())
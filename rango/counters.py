@@ -0,0 +1,224 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rango import page_cache
+from rango.models import Category, Page
+
+
+class ClickCounter:
+    """
+    Buffers page clicks in memory and writes them to Page.views in batches.
+    Clicks are aggregated per page, so a page clicked a hundred times between
+    two flushes costs a single UPDATE ... SET views = views + 100.
+    The increment is applied by the database, so concurrent workers never
+    overwrite each other's counts.
+
+    With background flushing, a timer thread also writes the buffer once it
+    is flush_interval seconds old, so a worker that goes idle doesn't sit on
+    its clicks until the next one arrives.
+    """
+
+    def __init__(self, flush_size=None, flush_interval=None, background=None):
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._background = background
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        # The database the buffered clicks were counted against.
+        self._database = None
+        self._timer_pid = None
+
+    @property
+    def flush_size(self):
+        if self._flush_size is not None:
+            return self._flush_size
+        return getattr(settings, "RANGO_CLICK_FLUSH_SIZE", 100)
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, "RANGO_CLICK_FLUSH_INTERVAL", 5.0)
+
+    @property
+    def background(self):
+        if self._background is not None:
+            return self._background
+        return getattr(settings, "RANGO_CLICK_FLUSH_BACKGROUND", True)
+
+    def record(self, page_id, count=1):
+        # Only the in-memory bookkeeping happens under the lock; the caller
+        # never waits on the database unless background flushing is off.
+        with self._lock:
+            self._database = connection.settings_dict["NAME"]
+            self._pending[page_id] = self._pending.get(page_id, 0) + count
+            self._pending_total += count
+            due = (self._pending_total >= self.flush_size or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+            if due and self._flushing:
+                due = False
+            if due:
+                self._flushing = True
+
+        if self.background:
+            self._start_timer()
+        if due:
+            if self.background:
+                threading.Thread(target=self._flush_in_thread, daemon=True).start()
+            else:
+                self._flush_and_release()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def discard(self):
+        """Drops the buffered clicks without writing them."""
+        with self._lock:
+            self._pending = {}
+            self._pending_total = 0
+            self._database = None
+
+    def flush(self):
+        """
+        Writes all buffered clicks to the database and returns the number of
+        clicks written. On failure the clicks are put back in the buffer.
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        try:
+            with transaction.atomic():
+                add_page_views(pending)
+                page_cache.pages_changed(list(pending))
+        except Exception:
+            with self._lock:
+                for page_id, delta in pending.items():
+                    self._pending[page_id] = self._pending.get(page_id, 0) + delta
+                    self._pending_total += delta
+            raise
+
+        return sum(pending.values())
+
+    def _flush_and_release(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    def _flush_in_thread(self):
+        try:
+            self._flush_and_release()
+        except Exception as e:
+            print(f"Click counter flush failed: {e}")
+        finally:
+            # Every thread gets its own connection; don't leak it.
+            connection.close()
+
+    def _start_timer(self):
+        # Threads don't survive a fork, so each worker process starts its own.
+        if self._timer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+        threading.Thread(target=self._run_timer, daemon=True, name="click-counter").start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                due = (self._pending_total and not self._flushing and
+                       time.monotonic() - self._last_flush >= self.flush_interval)
+                if due:
+                    self._flushing = True
+            if due:
+                self._flush_in_thread()
+
+    def flush_on_exit(self):
+        # Clicks counted against another database, such as a test database
+        # that has since been destroyed, must not land in this one.
+        if self._database != connection.settings_dict["NAME"]:
+            return
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+
+click_counter = ClickCounter()
+atexit.register(click_counter.flush_on_exit)
+
+
+def _group_by_delta(deltas):
+    # Rows with the same delta share one UPDATE statement.
+    by_delta = {}
+    for object_id, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(object_id)
+    return by_delta
+
+
+def add_page_views(deltas):
+    """Adds {page_id: views} to Page.views, marking the pages' categories modified."""
+    now = timezone.now()
+    for delta, page_ids in _group_by_delta(deltas).items():
+        Page.objects.filter(id__in=page_ids).update(views=F("views") + delta, updated_at=now)
+    Category.objects.filter(page__id__in=list(deltas)).update(updated_at=now)
+
+
+def add_category_likes(deltas):
+    """Adds {category_id: likes} to Category.likes."""
+    now = timezone.now()
+    for delta, category_ids in _group_by_delta(deltas).items():
+        Category.objects.filter(id__in=category_ids).update(likes=F("likes") + delta, updated_at=now)
+
+
+def _supports_update_returning():
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def increment_category_likes(category_id, delta=1):
+    """
+    Atomically adds delta to Category.likes and returns the new count, or
+    None if there is no such category. Where the database supports
+    UPDATE ... RETURNING this is a single round trip.
+    """
+    if _supports_update_returning():
+        qn = connection.ops.quote_name
+        table = qn(Category._meta.db_table)
+        likes = qn(Category._meta.get_field("likes").column)
+        updated_at = qn(Category._meta.get_field("updated_at").column)
+        pk = qn(Category._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {table} SET {likes} = {likes} + %s, {updated_at} = %s "
+                           f"WHERE {pk} = %s RETURNING {likes}",
+                           [delta, connection.ops.adapt_datetimefield_value(timezone.now()), category_id])
+            row = cursor.fetchone()
+        return row[0] if row else None
+    
+    with transaction.atomic():
+        if not Category.objects.filter(id=category_id).update(likes=F("likes") + delta,
+                                                             updated_at=timezone.now()):
+            return None
+        return Category.objects.filter(id=category_id).values_list("likes", flat=True).get()
@@ -0,0 +1,87 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Reads go to the databases in RANGO_READ_REPLICAS, writes to the primary
+# ("default"). Replicas lag behind the primary, so a user who has just
+# written must not read from one: the first write of a request pins the
+# rest of the request to the primary, and ReplicaPinningMiddleware keeps the
+# user's next requests there for RANGO_REPLICA_PIN_SECONDS.
+
+_state = threading.local()
+
+PIN_COOKIE = "rango_primary"
+
+
+def read_replicas():
+    return getattr(settings, "RANGO_READ_REPLICAS", [])
+
+
+def pin_to_primary():
+    _state.pinned = True
+
+
+def is_pinned():
+    return getattr(_state, "pinned", False)
+
+
+def has_written():
+    return getattr(_state, "written", False)
+
+
+def reset():
+    _state.pinned = False
+    _state.written = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = read_replicas()
+        if not replicas or is_pinned():
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction must see its writes.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.written = True
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every database holds the same data.
+        return True
+
+
+class ReplicaPinningMiddleware:
+    """
+    Gives requests that write, and the same browser's requests for a few
+    seconds afterwards, read-your-writes consistency by sending their reads
+    to the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset()
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            pin_to_primary()
+        try:
+            response = self.get_response(request)
+            if has_written() and read_replicas():
+                seconds = getattr(settings, "RANGO_REPLICA_PIN_SECONDS", 5)
+                response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds,
+                                    httponly=True, samesite="Lax")
+        finally:
+            reset()
+        return response
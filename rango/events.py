@@ -0,0 +1,97 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from rango import page_cache
+from rango.counters import add_category_likes, add_page_views
+from rango.models import Category, ClickEvent, EventCheckpoint
+from rango.suggestions import category_index
+
+
+# With RANGO_CLICK_EVENT_LOG on, goto_url and LikeCategoryView only append a
+# ClickEvent. The aggregate_events command folds the events into Page.views
+# and Category.likes in batches. Each batch is applied in the same
+# transaction that moves the aggregator's checkpoint past it, so after a
+# crash the batch is either fully applied or not at all, and no event is
+# lost or counted twice. The events are kept for replay and analysis.
+
+def event_log_enabled():
+    return getattr(settings, "RANGO_CLICK_EVENT_LOG", False)
+
+
+def record_view(page_id):
+    ClickEvent.objects.create(kind=ClickEvent.VIEW, object_id=page_id)
+
+
+def record_like(category_id):
+    ClickEvent.objects.create(kind=ClickEvent.LIKE, object_id=category_id)
+
+
+def pending_likes(category_id, name="default"):
+    """Likes of a category that are logged but not yet in Category.likes."""
+    last_event_id = EventCheckpoint.objects.filter(name=name).values_list("last_event_id", flat=True).first()
+    # Only the events after the checkpoint are scanned, along the primary key.
+    return ClickEvent.objects.filter(id__gt=last_event_id or 0, kind=ClickEvent.LIKE,
+                                     object_id=category_id).count()
+
+
+def aggregate(batch_size=None, lag=None, name="default"):
+    """
+    Applies the next batch of events and returns how many there were.
+
+    Events younger than lag seconds are left for the next run. On databases
+    where ids are handed out before commit, this lets slow transactions
+    commit their events before the checkpoint moves past them.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, "RANGO_EVENT_BATCH_SIZE", 5000)
+    if lag is None:
+        lag = getattr(settings, "RANGO_EVENT_AGGREGATION_LAG", 1)
+    cutoff = timezone.now() - timedelta(seconds=lag)
+
+    views = Counter()
+    likes = Counter()
+    with transaction.atomic():
+        checkpoint, created = EventCheckpoint.objects.select_for_update().get_or_create(name=name)
+        events = (ClickEvent.objects.filter(id__gt=checkpoint.last_event_id).order_by("id")
+                  .values_list("id", "kind", "object_id", "created_at")[:batch_size])
+        last_event_id = None
+        for event_id, kind, object_id, created_at in events:
+            if created_at > cutoff:
+                break
+            if kind == ClickEvent.VIEW:
+                views[object_id] += 1
+            else:
+                likes[object_id] += 1
+            last_event_id = event_id
+
+        if last_event_id is None:
+            return 0
+        if views:
+            add_page_views(views)
+        if likes:
+            add_category_likes(likes)
+        applied = sum(views.values()) + sum(likes.values())
+        checkpoint.last_event_id = last_event_id
+        checkpoint.save()
+
+    if views:
+        page_cache.pages_changed(list(views))
+    if likes:
+        page_cache.categories_changed(list(likes))
+        for category_id, count in Category.objects.filter(id__in=list(likes)).values_list("id", "likes"):
+            category_index.update_likes(category_id, count)
+    return applied
+
+
+def drain(batch_size=None, lag=None, name="default"):
+    """Applies batches until no events are due; returns the number applied."""
+    total = 0
+    while True:
+        applied = aggregate(batch_size, lag, name)
+        if not applied:
+            return total
+        total += applied
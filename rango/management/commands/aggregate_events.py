@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from rango import events
+
+
+class Command(BaseCommand):
+    help = ("Folds logged page views and category likes into Page.views and Category.likes. "
+            "Runs until interrupted, or once with --drain.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drain", action="store_true",
+                            help="Apply every event that is due, then exit.")
+        parser.add_argument("--interval", type=float, default=5.0,
+                            help="Seconds to wait between runs.")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--lag", type=float, default=None,
+                            help="Leave events younger than this many seconds for the next run.")
+
+    def handle(self, *args, **options):
+        while True:
+            applied = events.drain(options["batch_size"], options["lag"])
+            if applied or options["drain"]:
+                self.stdout.write(f"Applied {applied} event{'s' if applied != 1 else ''}.")
+            if options["drain"]:
+                return
+            # Don't hold a connection open while idle.
+            connection.close()
+            time.sleep(options["interval"])
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rango.models import UserProfile
+from rango.thumbnails import update_thumbnails
+
+
+class Command(BaseCommand):
+    help = ("Makes the thumbnails of profile pictures that don't have them yet, such as "
+            "pictures uploaded before thumbnails were introduced.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Remake the thumbnails of every profile picture, overwriting "
+                                 "existing ones, e.g. after changing the thumbnail sizes or quality.")
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(picture="")
+        if not options["all"]:
+            profiles = profiles.filter(thumbnail_hash="")
+
+        start = time.perf_counter()
+        done = failed = 0
+        for profile_id in profiles.values_list("id", flat=True).iterator():
+            try:
+                update_thumbnails(profile_id, overwrite=options["all"])
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Profile {profile_id}: {e}")
+        self.stdout.write(f"Made thumbnails for {done} profiles in {time.perf_counter() - start:.1f} s"
+                          + (f", {failed} failed" if failed else ""))
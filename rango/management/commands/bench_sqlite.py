@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, transaction
+
+from rango.bulk_loader import BulkLoader, generate_records
+from rango.counters import add_page_views, increment_category_likes
+from rango.models import Category, Page
+
+
+# Each worker process handles "requests" in a loop until the deadline, and
+# calls close_old_connections() after each one, as Django does at the end of
+# a request: with CONN_MAX_AGE = 0 that reconnects every time.
+
+def read_worker(slugs, start, deadline, results):
+    rng = random.Random(os.getpid())
+    timings = []
+    errors = 0
+    start.wait()
+    while time.time() < deadline.value:
+        began = time.perf_counter()
+        try:
+            # A category page: the category, then its most viewed pages.
+            category_id = Category.objects.filter(slug=rng.choice(slugs)).values_list("id", flat=True).first()
+            list(Page.objects.filter(category_id=category_id).order_by("-views")[:10].values_list("title", "url"))
+            timings.append(time.perf_counter() - began)
+        except OperationalError:
+            errors += 1
+        close_old_connections()
+    results.put(("read", timings, errors))
+
+
+def write_worker(page_ids, category_ids, start, deadline, results):
+    rng = random.Random(os.getpid())
+    timings = []
+    errors = 0
+    start.wait()
+    while time.time() < deadline.value:
+        began = time.perf_counter()
+        try:
+            # A click counter flush or a like.
+            if rng.random() < 0.8:
+                with transaction.atomic():
+                    add_page_views({rng.choice(page_ids): rng.randint(1, 5)})
+            else:
+                increment_category_likes(rng.choice(category_ids))
+            timings.append(time.perf_counter() - began)
+        except OperationalError:
+            errors += 1
+        close_old_connections()
+    results.put(("write", timings, errors))
+
+
+class Command(BaseCommand):
+    help = ("Measures read throughput on a SQLite database while other processes write "
+            "clicks and likes, with the default settings and with the production SQLite "
+            "mode (WAL, pragmas, busy timeout, persistent connections). Runs against "
+            "throwaway copies of a generated database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--categories", type=int, default=200)
+        parser.add_argument("--pages", type=int, default=20000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            self.stderr.write("The default database isn't SQLite; nothing to compare.")
+            return
+
+        settings_dict = connection.settings_dict
+        saved = {key: settings_dict.get(key) for key in ("NAME", "CONN_MAX_AGE")}
+        saved_tuning = getattr(settings, "RANGO_SQLITE_TUNING", False)
+        directory = tempfile.mkdtemp(prefix="rango-bench-")
+        try:
+            template = os.path.join(directory, "template.sqlite3")
+            self.use_database(template, production=False)
+            call_command("migrate", verbosity=0, interactive=False)
+            BulkLoader().load(generate_records(options["categories"], options["pages"], seed=options["seed"]))
+            slugs = list(Category.objects.values_list("slug", flat=True))
+            category_ids = list(Category.objects.values_list("id", flat=True))
+            page_ids = list(Page.objects.values_list("id", flat=True))
+            connection.close()
+
+            self.stdout.write(f"{options['readers']} readers, {options['writers']} writers, "
+                              f"{options['seconds']:g} s, {len(slugs)} categories, {len(page_ids)} pages")
+            for label, production in (("default", False), ("production", True)):
+                # WAL mode sticks to the file, so each mode gets a fresh copy.
+                path = os.path.join(directory, f"{label}.sqlite3")
+                shutil.copyfile(template, path)
+                self.use_database(path, production)
+                self.report(label, self.run(options, slugs, page_ids, category_ids), options["seconds"])
+        finally:
+            connection.close()
+            settings_dict.update(saved)
+            settings.RANGO_SQLITE_TUNING = saved_tuning
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def use_database(self, path, production):
+        connection.close()
+        connection.settings_dict.update(NAME=path, CONN_MAX_AGE=600 if production else 0)
+        settings.RANGO_SQLITE_TUNING = production
+
+    def run(self, options, slugs, page_ids, category_ids):
+        # Forked workers inherit the settings above; the connection is closed,
+        # so each opens its own.
+        context = multiprocessing.get_context("fork")
+        start = context.Event()
+        deadline = context.Value("d", 0.0)
+        results = context.Queue()
+        workers = [context.Process(target=read_worker, args=(slugs, start, deadline, results))
+                   for i in range(options["readers"])]
+        workers += [context.Process(target=write_worker, args=(page_ids, category_ids, start, deadline, results))
+                    for i in range(options["writers"])]
+        for worker in workers:
+            worker.start()
+        deadline.value = time.time() + options["seconds"]
+        start.set()
+
+        collected = {"read": ([], 0), "write": ([], 0)}
+        for worker in workers:
+            role, timings, errors = results.get()
+            all_timings, all_errors = collected[role]
+            collected[role] = (all_timings + timings, all_errors + errors)
+        for worker in workers:
+            worker.join()
+        return collected
+
+    def report(self, label, collected, seconds):
+        self.stdout.write(f"{label}:")
+        for role in ("read", "write"):
+            timings, errors = collected[role]
+            timings.sort()
+            if timings:
+                p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+                latency = f"p50 {timings[len(timings) // 2] * 1000:.2f} ms, p99 {p99:.2f} ms"
+            else:
+                latency = "no successful requests"
+            self.stdout.write(f"  {role}s: {len(timings) / seconds:.0f}/s, {errors} failed, {latency}")
@@ -0,0 +1,64 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from rango.suggestions import CategoryEntry, CategoryPrefixIndex, SuggestionResponses
+
+
+class Command(BaseCommand):
+    help = "Benchmarks category suggestion lookups against a synthetic prefix index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=100000)
+        parser.add_argument("--queries", type=int, default=20000)
+        parser.add_argument("--limit", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        names = set()
+        while len(names) < options["categories"]:
+            length = rng.randint(4, 16)
+            names.add("".join(rng.choice(string.ascii_letters + " ") for i in range(length)).strip() or "x")
+        entries = [CategoryEntry(i, name, name.lower(), int(rng.paretovariate(1.2)))
+                   for i, name in enumerate(names, start=1)]
+
+        index = CategoryPrefixIndex(loader=lambda: entries, max_age=float("inf"))
+        start = time.perf_counter()
+        index.build()
+        self.stdout.write(f"Built index over {len(index)} categories in "
+                          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+        prefixes = ["".join(rng.choice(string.ascii_lowercase) for i in range(rng.randint(1, 4)))
+                    for q in range(options["queries"])]
+        self.report("index lookups", prefixes, lambda prefix: index.search(prefix, limit=options["limit"]))
+
+        # An index that is always stale: lookups keep being answered while it
+        # is rebuilt in the background.
+        rebuilding = CategoryPrefixIndex(loader=lambda: entries, max_age=0)
+        rebuilding.build()
+        self.report("index lookups during rebuilds", prefixes,
+                    lambda prefix: rebuilding.search(prefix, limit=options["limit"]))
+
+        # The JSON endpoint: popular prefixes are asked for over and over.
+        responses = SuggestionResponses(index)
+        popular = [prefixes[min(int(rng.paretovariate(1.0)) - 1, len(prefixes) - 1)]
+                   for q in range(options["queries"])]
+        self.report("JSON responses", popular, lambda prefix: responses.get(prefix, options["limit"]))
+        self.stdout.write(f"Response cache: {responses.cache.stats()}")
+
+    def report(self, label, prefixes, lookup):
+        timings = []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            lookup(prefix)
+            timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))] * 1e6
+        self.stdout.write(f"{len(timings)} {label}: mean {sum(timings) / len(timings) * 1e6:.1f} us, "
+                          f"p50 {percentile(0.5):.1f} us, p99 {percentile(0.99):.1f} us, "
+                          f"max {timings[-1] * 1e6:.1f} us")
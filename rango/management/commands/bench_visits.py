@@ -0,0 +1,57 @@
+from datetime import datetime
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+
+def legacy_visitor_cookie_handler(request):
+    # The handler as it was before visits were only written once a day.
+    visits = int(request.session.get("visits") or "1")
+    last_visit_cookie = request.session.get("last_visit") or str(datetime.now())
+    last_visit_time = datetime.strptime(last_visit_cookie[:-7], "%Y-%m-%d %H:%M:%S")
+    if (datetime.now() - last_visit_time).days > 0:
+        visits += 1
+        request.session["last_visit"] = str(datetime.now())
+    else:
+        request.session["last_visit"] = last_visit_cookie
+    request.session["visits"] = visits
+
+
+class Command(BaseCommand):
+    help = ("Counts the session writes made by home page requests, with the current "
+            "and the old visit tracking. Runs against a throwaway test database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            legacy = self.session_writes(options["requests"], legacy_visitor_cookie_handler)
+            current = self.session_writes(options["requests"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        requests = options["requests"]
+        self.stdout.write(f"{requests} home page requests from one visitor:")
+        self.stdout.write(f"  old visit tracking:     {legacy} session writes ({legacy / requests:.2f} per request)")
+        self.stdout.write(f"  current visit tracking: {current} session writes ({current / requests:.2f} per request)")
+
+    def session_writes(self, requests, handler=None):
+        client = Client()
+        with CaptureQueriesContext(connection) as queries:
+            if handler is None:
+                for i in range(requests):
+                    client.get(reverse("rango:index"))
+            else:
+                with mock.patch("rango.views.visitor_cookie_handler", handler):
+                    for i in range(requests):
+                        client.get(reverse("rango:index"))
+        return sum(1 for query in queries
+                   if "django_session" in query["sql"] and query["sql"].startswith(("INSERT", "UPDATE")))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from rango.models import Category
+from rango.query_plans import explain, hot_queries, plan_problems
+
+
+class Command(BaseCommand):
+    help = "Checks that the ranking queries of the rango views are answered from an index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--category", help="Slug of the category to use (default: the largest).")
+
+    def handle(self, *args, **options):
+        if options["category"]:
+            category_id = Category.objects.filter(slug=options["category"]).values_list("id", flat=True).first()
+        else:
+            category_id = (Category.objects.annotate(pages=Count("page")).order_by("-pages", "id")
+                           .values_list("id", flat=True).first())
+        if category_id is None:
+            raise CommandError("No category to check; load some data first.")
+
+        failed = False
+        for name, queryset in hot_queries(category_id).items():
+            plan = explain(queryset)
+            problems = plan_problems(plan)
+            failed = failed or bool(problems)
+            self.stdout.write(f"{'FAIL' if problems else 'ok'}  {name}")
+            for line in plan:
+                self.stdout.write(f"      {line}")
+
+        if failed:
+            raise CommandError("Some queries sort or scan the whole table.")
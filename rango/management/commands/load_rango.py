@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rango.bulk_loader import BulkLoader, generate_records, read_records, write_records
+
+
+class Command(BaseCommand):
+    help = ("Loads categories and pages from a .jsonl or .csv file, or generates "
+            "a synthetic dataset with --generate.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="File to load (or, with --generate and --output, to write).")
+        parser.add_argument("--generate", action="store_true", help="Generate a synthetic dataset.")
+        parser.add_argument("--categories", type=int, default=1000)
+        parser.add_argument("--pages", type=int, default=100000)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--output", action="store_true",
+                            help="With --generate, write the dataset to path instead of loading it.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--no-upsert", action="store_true",
+                            help="Don't look for existing rows; only use this on an empty database.")
+
+    def handle(self, *args, **options):
+        if options["generate"]:
+            records = generate_records(options["categories"], options["pages"], seed=options["seed"])
+            if options["output"]:
+                if not options["path"]:
+                    raise CommandError("--output needs a path to write to.")
+                write_records(records, options["path"])
+                return
+        elif options["path"]:
+            records = read_records(options["path"])
+        else:
+            raise CommandError("Give a file to load or use --generate.")
+
+        start = time.perf_counter()
+        loader = BulkLoader(batch_size=options["batch_size"], upsert=not options["no_upsert"]).load(records)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Created {loader.created['categories']} categories and {loader.created['pages']} pages, "
+                          f"updated {loader.updated['categories']} categories and {loader.updated['pages']} pages "
+                          f"in {elapsed:.1f} s.")
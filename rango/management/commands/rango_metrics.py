@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from rango import metrics
+
+
+class Command(BaseCommand):
+    help = ("Prints the per-view request metrics published by the workers. "
+            "Needs a cache shared by the workers and this command.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Print the raw numbers as JSON.")
+
+    def handle(self, *args, **options):
+        snapshot = metrics.collect()
+        if options["json"]:
+            self.stdout.write(json.dumps(snapshot, indent=2, default=str))
+            return
+
+        self.stdout.write(f"{'view':32} {'requests':>9} {'avg ms':>8} {'queries':>8} "
+                          f"{'db ms':>8} {'tpl ms':>8}")
+        for view, stats in sorted(snapshot.items(), key=lambda item: -item[1]["latency"]):
+            requests = stats["requests"] or 1
+            self.stdout.write(f"{view:32} {stats['requests']:9d} {stats['latency'] / requests * 1000:8.2f} "
+                              f"{stats['queries'] / requests:8.1f} {stats['db_time'] / requests * 1000:8.2f} "
+                              f"{stats['template_time'] / requests * 1000:8.2f}")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rango.replication import copy_sqlite_database
+
+
+class Command(BaseCommand):
+    help = ("Copies the default SQLite database to a replica database, once or every --interval "
+            "seconds, to try out RANGO_READ_REPLICAS locally.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--replica", default="replica")
+        parser.add_argument("--interval", type=float, default=None,
+                            help="Keep copying, waiting this many seconds in between.")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            copy_sqlite_database(target=options["replica"])
+            self.stdout.write(f"Copied to {options['replica']} in {(time.perf_counter() - start) * 1000:.1f} ms")
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,163 @@
+import mimetypes
+import os
+import re
+from stat import S_ISREG
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+
+# Serves files from MEDIA_ROOT without reading them into the worker.
+#
+# With RANGO_MEDIA_SENDFILE = "x-sendfile" (Apache mod_xsendfile, lighttpd)
+# or "x-accel-redirect" (nginx), the response only names the file and the
+# web server sends it. Otherwise the file is streamed with FileResponse,
+# which the WSGI server can hand to sendfile(). Either way the response
+# carries validators, supports Range requests and, for content-hashed names
+# such as thumbnails, may be cached forever.
+
+# A run of hex digits between dots marks a file whose name changes with its
+# content: "<sha1>.30.jpg", "rango.1a2b3c4d5e6f.js".
+HASHED_NAME = re.compile(r"(^|\.)[0-9a-f]{12,}\.")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def cache_control(path):
+    if HASHED_NAME.search(os.path.basename(path)):
+        return IMMUTABLE
+    return f"public, max-age={getattr(settings, 'RANGO_MEDIA_MAX_AGE', 60 * 60)}"
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) of a single "bytes=" range, end inclusive, None if
+    there is no usable range header, or False if the range can't be
+    satisfied. Multiple ranges are answered with the whole file.
+    """
+    match = RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # The last n bytes.
+        length = int(end)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class FileRange:
+    """A file-like object reading length bytes of f from start on."""
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self._file = f
+        self._remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def file_response(request, full_path, stat=None, content_type=None, sendfile_path=None):
+    """
+    Responds with the file at full_path, honouring conditional and Range
+    requests. sendfile_path is the path the web server should be told to
+    send, when sendfile offload is configured.
+    """
+    if stat is None:
+        stat = os.stat(full_path)
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    if content_type is None:
+        content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        mode = getattr(settings, "RANGO_MEDIA_SENDFILE", None)
+        if mode and sendfile_path:
+            # The web server handles ranges itself.
+            response = HttpResponse(content_type=content_type)
+            if mode == "x-accel-redirect":
+                # nginx takes a URI here and decodes it, and header values
+                # must be latin-1, so names with spaces or non-ASCII letters
+                # are percent-encoded.
+                response["X-Accel-Redirect"] = quote(sendfile_path)
+            else:
+                response["X-Sendfile"] = full_path
+        else:
+            response = _stream(request, full_path, stat, etag, last_modified, content_type)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = cache_control(full_path)
+    return response
+
+
+def _stream(request, full_path, stat, etag, last_modified, content_type):
+    byte_range = None
+    if "HTTP_RANGE" in request.META:
+        # A range of a file that has changed since If-Range is useless to
+        # the client; send the whole file instead.
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+            byte_range = parse_range(request.META["HTTP_RANGE"], stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+
+    f = open(full_path, "rb")
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+        response["Content-Length"] = stat.st_size
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(f, start, end - start + 1), status=206, content_type=content_type)
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found.")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("File not found.")
+    if not S_ISREG(stat.st_mode):
+        raise Http404("File not found.")
+
+    # nginx maps this internal location onto MEDIA_ROOT.
+    accel_prefix = getattr(settings, "RANGO_MEDIA_ACCEL_PREFIX", "/protected-media/")
+    return file_response(request, full_path, stat, sendfile_path=accel_prefix + path)
@@ -0,0 +1,179 @@
+import threading
+import time
+
+from django.conf import settings
+from django.template.base import Template
+
+from rango.caching import WorkerSnapshots
+
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+FIELDS = ("requests", "latency", "queries", "db_time", "template_time")
+
+
+def empty_stats():
+    stats = dict.fromkeys(FIELDS, 0)
+    stats["buckets"] = [0] * len(LATENCY_BUCKETS)
+    return stats
+
+
+def merge(into, snapshot):
+    for view, stats in snapshot.items():
+        total = into.setdefault(view, empty_stats())
+        for field in FIELDS:
+            total[field] += stats[field]
+        total["buckets"] = [a + b for a, b in zip(total["buckets"], stats["buckets"])]
+    return into
+
+
+class MetricsRegistry:
+    """
+    Per-view request metrics for this worker process. Each thread records
+    into its own shard, which no other thread writes to, so recording never
+    takes a lock; the shards are only summed when the metrics are read.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # Taken once per thread, not once per request.
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, view, latency, queries=0, db_time=0, template_time=0):
+        shard = self._shard()
+        stats = shard.get(view)
+        if stats is None:
+            stats = shard[view] = empty_stats()
+        stats["requests"] += 1
+        stats["latency"] += latency
+        stats["queries"] += queries
+        stats["db_time"] += db_time
+        stats["template_time"] += template_time
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                stats["buckets"][i] += 1
+                break
+
+    def snapshot(self):
+        totals = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            merge(totals, {view: dict(stats, buckets=list(stats["buckets"]))
+                           for view, stats in list(shard.items())})
+        return totals
+
+    def reset(self):
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+registry = MetricsRegistry()
+
+
+# Workers publish their snapshots to the cache, so the metrics endpoint and
+# the rango_metrics command can report on all of them when the cache is
+# shared between processes.
+
+workers = WorkerSnapshots("metrics")
+
+
+def publish(timeout=None):
+    if timeout is None:
+        timeout = getattr(settings, "RANGO_METRICS_PUBLISH_TIMEOUT", 60 * 60)
+    workers.publish(registry.snapshot(), timeout)
+
+
+def collect():
+    """Returns the metrics of every worker that has published them."""
+    totals = {}
+    for snapshot in workers.collect():
+        merge(totals, snapshot)
+    return totals
+
+
+def render_text(snapshot):
+    """Renders a snapshot in the Prometheus text exposition format."""
+    lines = [
+        "# HELP rango_request_duration_seconds Request latency by view.",
+        "# TYPE rango_request_duration_seconds histogram",
+    ]
+    for view, stats in sorted(snapshot.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'rango_request_duration_seconds_bucket{{view="{view}",le="{le}"}} {cumulative}')
+        lines.append(f'rango_request_duration_seconds_sum{{view="{view}"}} {stats["latency"]:.6f}')
+        lines.append(f'rango_request_duration_seconds_count{{view="{view}"}} {stats["requests"]}')
+
+    for name, field, kind, help_text in (
+            ("rango_db_queries_total", "queries", "counter", "Database queries by view."),
+            ("rango_db_seconds_total", "db_time", "counter", "Time spent in the database by view."),
+            ("rango_template_seconds_total", "template_time", "counter", "Template render time by view.")):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for view, stats in sorted(snapshot.items()):
+            lines.append(f'{name}{{view="{view}"}} {stats[field]:g}')
+    return "\n".join(lines) + "\n"
+
+
+# Template render time is measured by wrapping Template.render. Included
+# templates render inside their parent, so only the outermost render counts.
+
+_request_state = threading.local()
+_original_render = Template.render
+
+
+def _instrumented_render(self, context):
+    state = getattr(_request_state, "current", None)
+    if state is None or state.template_depth:
+        return _original_render(self, context)
+    state.template_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        state.template_time += time.perf_counter() - start
+        state.template_depth -= 1
+
+
+def instrument_templates():
+    Template.render = _instrumented_render
+
+
+class RequestState:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # A connection.execute_wrapper, wrapped around every query.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+def start_request():
+    state = _request_state.current = RequestState()
+    return state
+
+
+def end_request():
+    _request_state.current = None
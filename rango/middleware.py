@@ -0,0 +1,43 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from rango import metrics
+
+
+class MetricsMiddleware:
+    """
+    Records, for every request, the latency, the number of database queries
+    and the time spent on them, and the template render time, under the
+    resolved URL name of the view (e.g. "rango:index").
+    Put it first in MIDDLEWARE so the latency covers the other middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.publish_interval = getattr(settings, "RANGO_METRICS_PUBLISH_INTERVAL", 10)
+        self.last_publish = time.monotonic()
+        metrics.instrument_templates()
+
+    def __call__(self, request):
+        state = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(state))
+                response = self.get_response(request)
+        finally:
+            metrics.end_request()
+        latency = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unresolved"
+        metrics.registry.observe(view, latency, state.queries, state.db_time, state.template_time)
+
+        if time.monotonic() - self.last_publish >= self.publish_interval:
+            self.last_publish = time.monotonic()
+            metrics.publish()
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rango', '0003_auto_20200204_1810'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryLike',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rango.Category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='categorylike',
+            constraint=models.UniqueConstraint(fields=('user', 'category'), name='unique_category_like'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0004_categorylike'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['-likes'], name='category_likes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['category', '-views', '-id'], name='page_category_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['-views', '-id'], name='page_views_idx'),
+        ),
+    ]
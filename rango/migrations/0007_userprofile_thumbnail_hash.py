@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='thumbnail_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.template.defaultfilters import slugify
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Category(models.Model):
@@ -9,6 +10,8 @@ class Category(models.Model):
     views = models.IntegerField(default=0)
     likes = models.IntegerField(default=0)
     slug = models.SlugField(unique=True)
+    # Also moved forward whenever one of the category's pages changes.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
@@ -16,6 +19,10 @@ class Category(models.Model):
     
     class Meta:
         verbose_name_plural = "Categories"
+        indexes = [
+            # Most liked categories: order_by("-likes").
+            models.Index(fields=["-likes"], name="category_likes_idx"),
+        ]
     
     def __str__(self):
         return self.name
@@ -28,10 +35,62 @@ class Page(models.Model):
     MAX_LENGTH_URL = 200
     url = models.URLField(max_length=MAX_LENGTH_URL)
     views = models.IntegerField(default=0)
-
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Most viewed pages in a category: filter(category=...).order_by("-views").
+            models.Index(fields=["category", "-views", "-id"], name="page_category_views_idx"),
+            # Most viewed pages overall: order_by("-views").
+            models.Index(fields=["-views", "-id"], name="page_views_idx"),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class CategoryLike(models.Model):
+    # One row per (user, category): a user can only like a category once.
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category"], name="unique_category_like"),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} likes {self.category}"
+    
+    
+class ClickEvent(models.Model):
+    """
+    One page view or category like, appended by the request and folded into
+    Page.views or Category.likes later by rango.events.aggregate(). The
+    table has no index besides its primary key, so an append is as cheap as
+    an insert gets; object_id isn't a foreign key for the same reason.
+    """
+    VIEW = "v"
+    LIKE = "l"
+    KINDS = ((VIEW, "Page view"), (LIKE, "Category like"))
+    
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=1, choices=KINDS)
+    object_id = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.object_id}"
+
+
+class EventCheckpoint(models.Model):
+    # The last ClickEvent an aggregator has applied, committed together with
+    # the counts it applied.
+    name = models.CharField(max_length=64, primary_key=True)
+    last_event_id = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name} at {self.last_event_id}"
     
     
 class UserProfile(models.Model):
@@ -40,6 +99,19 @@ class UserProfile(models.Model):
     # The additional attributes we wish to include.
     website = models.URLField(blank=True)
     picture = models.ImageField(upload_to="profile_images", blank=True)
+    # Content hash of the picture, set once its thumbnails have been made.
+    thumbnail_hash = models.CharField(max_length=40, blank=True, editable=False)
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_picture = self.__dict__.get("picture")
+    
+    def save(self, *args, **kwargs):
+        # The thumbnails belong to the old picture until new ones are made.
+        if str(self.picture or "") != str(self._saved_picture or ""):
+            self.thumbnail_hash = ""
+        super().save(*args, **kwargs)
+        self._saved_picture = self.picture.name
     
     def __str__(self):
         return self.user.username
\ No newline at end of file
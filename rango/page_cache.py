@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from rango import db_router
+from rango.caching import bump_version, cache_timeout, get_version
+from rango.models import Category
+from rango.trending import trending
+
+
+# Whole responses for anonymous visitors are cached under keys built from
+# the versions of the data they show:
+#
+#   "categories"       the sidebar, on every page (bumped by Category signals)
+#   "rankings"         the most liked categories and most viewed pages
+#   "category:<slug>"  a category's likes and its pages
+#
+# so a change to a row bumps exactly the versions of the pages showing it.
+# The home page's key also changes every minute, for its trending lists.
+
+def index_key():
+    return (f"rango:page:index:{get_version('categories')}:{get_version('rankings')}:"
+            f"{trending.hour.period()}")
+
+
+def category_key(slug):
+    return (f"rango:page:category:{slug}:{get_version('categories')}:"
+            f"{get_version('category:' + slug)}")
+
+
+def invalidate_rankings():
+    bump_version("rankings")
+
+
+def invalidate_categories(slugs):
+    for slug in slugs:
+        bump_version("category:" + slug)
+
+
+def categories_changed(category_ids):
+    """Call after likes were updated without Category.save()."""
+    invalidate_rankings()
+    invalidate_categories(Category.objects.filter(id__in=category_ids).values_list("slug", flat=True))
+
+
+def pages_changed(page_ids):
+    """Call after pages were updated without Page.save(), e.g. their views."""
+    invalidate_rankings()
+    invalidate_categories(Category.objects.filter(page__id__in=page_ids).values_list("slug", flat=True).distinct())
+
+
+class AnonymousPageCacheMixin:
+    """
+    Serves GET requests from anonymous visitors from a cache of whole
+    responses. Logged-in users see like buttons and search forms, so their
+    requests always go to the view. Subclasses define page_cache_key() and
+    may override page_cache_hit() for per-request work that must still
+    happen when the response comes from the cache.
+    """
+
+    def page_cache_key(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def page_cache_hit(self, request, response):
+        pass
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != "GET" or request.GET or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = self.page_cache_key(request, *args, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type, validators = cached
+            response = HttpResponse(content, content_type=content_type)
+            for header, value in validators.items():
+                response[header] = value
+            self.page_cache_hit(request, response)
+            # The view's validators were stored with the page, so a cached
+            # page can still be answered with a 304.
+            return get_conditional_response(
+                request, etag=validators.get("ETag"),
+                last_modified=parse_http_date_safe(validators.get("Last-Modified", "")),
+                response=response)
+
+        # The page is cached under the current versions, so it must be built
+        # from the primary: a lagging replica could still have the data from
+        # before the change that bumped them.
+        db_router.pin_to_primary()
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            validators = {header: response[header] for header in ("ETag", "Last-Modified")
+                          if response.has_header(header)}
+            cache.set(key, (response.content, response["Content-Type"], validators),
+                      cache_timeout(getattr(settings, "RANGO_PAGE_CACHE_TIMEOUT", 60 * 5)))
+        return response
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from rango.caching import cache_timeout, versioned_key
+from rango.models import Page, UserProfile
+
+
+# Category page listings are paginated by keyset (seek) rather than by
+# OFFSET: the cursor holds the (views, id) of the last page shown, and the
+# next batch starts right after it in the (category, -views, -id) index. Every
+# batch costs the same however far down the user has scrolled.
+
+def page_listing_size():
+    return getattr(settings, "RANGO_PAGE_LISTING_SIZE", 5)
+
+
+def encode_cursor(page):
+    return f"{page.views}.{page.id}"
+
+
+def decode_cursor(cursor):
+    """Returns (views, id) from a cursor, or None if it is missing or malformed."""
+    try:
+        views, page_id = cursor.split(".")
+        return int(views), int(page_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def category_pages_querysets(category_id, after=None):
+    """
+    Returns the querysets that list a category's pages after the cursor
+    position, in order. Each one is a single seek into the index: first the
+    rest of the pages tied on the cursor's view count, then the pages with
+    fewer views. (One OR-ed condition would make the database scan the whole
+    tied group, and generated and real data both have long runs of ties.)
+    """
+    pages = Page.objects.filter(category_id=category_id)
+    if after is None:
+        return [pages.order_by("-views", "-id")]
+    views, page_id = after
+    return [pages.filter(views=views, id__lt=page_id).order_by("-id"),
+            pages.filter(views__lt=views).order_by("-views", "-id")]
+
+
+def category_pages(category_id, cursor=None, limit=None):
+    """
+    Returns the next batch of a category's pages, most viewed first, and the
+    cursor for the batch after it (None if this is the last one).
+    """
+    if limit is None:
+        limit = page_listing_size()
+    pages = []
+    for queryset in category_pages_querysets(category_id, decode_cursor(cursor)):
+        pages.extend(queryset[:limit + 1 - len(pages)])
+        if len(pages) > limit:
+            break
+    next_cursor = encode_cursor(pages[limit - 1]) if len(pages) > limit else None
+    return pages[:limit], next_cursor
+
+
+def profile_listing_size():
+    return getattr(settings, "RANGO_PROFILE_LISTING_SIZE", 50)
+
+
+def user_profiles(after=None, limit=None):
+    """
+    Returns the next batch of user profiles (with their users, fetched in the
+    same query) after the profile with id after, and the id to continue from
+    (None if this is the last batch).
+    """
+    if limit is None:
+        limit = profile_listing_size()
+    profiles = UserProfile.objects.select_related("user").order_by("id")
+    try:
+        profiles = profiles.filter(id__gt=int(after))
+    except (TypeError, ValueError):
+        pass
+    profiles = list(profiles[:limit + 1])
+    next_after = profiles[limit - 1].id if len(profiles) > limit else None
+    return profiles[:limit], next_after
+
+
+def user_profile_count():
+    # Counting is a full index scan, so the total is cached until a profile
+    # is created or deleted.
+    key = versioned_key("profiles", "count")
+    count = cache.get(key)
+    if count is None:
+        # From the primary, which already has the change that bumped the version.
+        count = UserProfile.objects.using(DEFAULT_DB_ALIAS).count()
+        cache.set(key, count, cache_timeout(60 * 60))
+    return count
@@ -0,0 +1,40 @@
+from django.db import connection
+
+from rango.models import Category, Page
+from rango.pagination import category_pages_querysets
+
+
+def hot_queries(category_id):
+    """The most frequent ranking queries, keyed by the view that runs them."""
+    return {
+        "index: most liked categories": Category.objects.order_by("-likes")[:5],
+        "index: most viewed pages": Page.objects.order_by("-views")[:5],
+        "show_category: top pages": Page.objects.filter(category_id=category_id).order_by("-views")[:5],
+        "page_listing: first batch": category_pages_querysets(category_id)[0][:6],
+        "page_listing: rest of a tie": category_pages_querysets(category_id, after=(10, 10**6))[0][:6],
+        "page_listing: fewer views": category_pages_querysets(category_id, after=(10, 10**6))[1][:6],
+    }
+
+
+def explain(queryset):
+    """Returns the database's query plan for queryset as a list of lines."""
+    sql, params = queryset.query.sql_with_params()
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """
+    Returns the lines of plan that show a full table scan or a sort of the
+    result, which an index matching the query's ORDER BY should avoid.
+    """
+    problems = []
+    for line in plan:
+        if connection.vendor == "sqlite":
+            if "TEMP B-TREE" in line or ("SCAN" in line and "INDEX" not in line):
+                problems.append(line)
+        elif "Sort" in line or "Seq Scan" in line or "filesort" in line:
+            problems.append(line)
+    return problems
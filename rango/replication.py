@@ -0,0 +1,16 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_sqlite_database(source=DEFAULT_DB_ALIAS, target="replica"):
+    """
+    Makes the target SQLite database an exact copy of the source, using
+    SQLite's online backup API. It stands in for real replication when
+    trying out read replicas locally.
+    """
+    source_connection = connections[source]
+    target_connection = connections[target]
+    if source_connection.vendor != "sqlite" or target_connection.vendor != "sqlite":
+        raise ValueError("Only SQLite databases can be copied.")
+    source_connection.ensure_connection()
+    target_connection.ensure_connection()
+    source_connection.connection.backup(target_connection.connection)
@@ -0,0 +1,261 @@
+import asyncio
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+
+from rango.models import Category, Page
+
+
+class SearchBackend:
+    """
+    Interface behind run_query. search() returns a list of results, each a
+    dictionary with "title", "link" and "summary" keys, and raises OSError or
+    ValueError if the search could not be carried out.
+    """
+
+    # Whether run_query may cache this backend's results.
+    cacheable = True
+
+    def search(self, search_terms):
+        raise NotImplementedError
+
+    async def asearch(self, search_terms):
+        """
+        The asyncio version of search(). By default search() is run in the
+        event loop's thread pool; backends with a native async client
+        override this.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.search, search_terms)
+
+    def object_saved(self, instance):
+        """Called when a Page or Category has been saved."""
+
+    def object_deleted(self, instance):
+        """Called when a Page or Category has been deleted."""
+
+
+class BingSearchBackend(SearchBackend):
+    """Searches the web with the Bing search API."""
+
+    def search(self, search_terms):
+        from rango.bing_search import fetch_results
+        return fetch_results(search_terms)
+
+    async def asearch(self, search_terms):
+        from rango.bing_search import get_async_search_client, httpx
+        if httpx is None:
+            return await super().asearch(search_terms)
+        return await get_async_search_client().search(search_terms)
+
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+# Parts of URLs shared by nearly every page. Indexed, they would match any
+# query containing them, such as a pasted URL, against the whole corpus.
+URL_STOP_TOKENS = {"http", "https", "www", "html", "htm", "php", "asp", "aspx"}
+
+
+def url_tokens(url):
+    """
+    The words of a URL worth searching for: the host's labels other than
+    the top-level domain, and the words of the path and query.
+    """
+    parts = urlsplit(url)
+    if parts.netloc:
+        labels = (parts.hostname or "").split(".")[:-1]
+        tokens = tokenize(" ".join(labels)) + tokenize(" ".join((parts.path, parts.query)))
+    else:
+        tokens = tokenize(url)
+    return [token for token in tokens if token not in URL_STOP_TOKENS]
+
+
+class InvertedIndex:
+    """
+    An in-process inverted index. Each document is a bag of tokens; a query
+    is scored with BM25 over the documents that contain at least one of its
+    terms and then boosted by the document's view count.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    VIEWS_WEIGHT = 0.1
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._documents = {}
+        self._total_length = 0
+
+    def add(self, key, tokens, result, views=0):
+        with self._lock:
+            self.remove(key)
+            counts = Counter(tokens)
+            self._documents[key] = (result, views, len(tokens), counts)
+            self._total_length += len(tokens)
+            for token, count in counts.items():
+                self._postings.setdefault(token, {})[key] = count
+
+    def remove(self, key):
+        with self._lock:
+            document = self._documents.pop(key, None)
+            if document is None:
+                return
+            result, views, length, counts = document
+            self._total_length -= length
+            for token in counts:
+                postings = self._postings[token]
+                del postings[key]
+                if not postings:
+                    del self._postings[token]
+
+    def search(self, search_terms, limit=10):
+        terms = set(tokenize(search_terms))
+        with self._lock:
+            if not terms or not self._documents:
+                return []
+            document_count = len(self._documents)
+            average_length = self._total_length / document_count
+
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, frequency in postings.items():
+                    length = self._documents[key][2]
+                    norm = frequency + self.K1 * (1 - self.B + self.B * length / average_length)
+                    scores[key] = scores.get(key, 0) + idf * frequency * (self.K1 + 1) / norm
+
+            ranked = heapq.nlargest(limit, scores, key=lambda key: scores[key] * (
+                1 + self.VIEWS_WEIGHT * math.log1p(max(self._documents[key][1], 0))))
+            return [self._documents[key][0] for key in ranked]
+
+    def __len__(self):
+        return len(self._documents)
+
+
+class LocalSearchBackend(SearchBackend):
+    """
+    Searches Rango's own pages and categories without going over the network.
+    Page titles and URLs and category names are held in an inverted index,
+    which is built on first use and kept current by this process's Page and
+    Category save and delete signals. Bulk updates such as click counts, and
+    other processes' changes, don't fire those signals, so the index is also
+    rebuilt in the background every RANGO_LOCAL_SEARCH_MAX_AGE seconds and
+    swapped in whole; saves and deletes made meanwhile are replayed onto it.
+    """
+
+    # Searches are answered from memory, so there is nothing to gain from caching.
+    cacheable = False
+
+    def __init__(self, max_age=None):
+        self.index = None
+        self._max_age = max_age
+        self._built_at = None
+        self._build_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        # Saves and deletes made while a rebuild is loading.
+        self._replay = None
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        return getattr(settings, "RANGO_LOCAL_SEARCH_MAX_AGE", 300)
+
+    def search(self, search_terms, limit=10):
+        return self.get_index().search(search_terms, limit)
+
+    def get_index(self):
+        if self.index is None:
+            with self._build_lock:
+                if self.index is None:
+                    self.index = self.build_index()
+                    self._built_at = time.monotonic()
+        elif time.monotonic() - self._built_at > self.max_age:
+            with self._lock:
+                start = not self._rebuilding
+                self._rebuilding = True
+            if start:
+                threading.Thread(target=self._rebuild_in_thread, daemon=True).start()
+        return self.index
+
+    def _rebuild_in_thread(self):
+        with self._lock:
+            self._replay = []
+        try:
+            index = self.build_index()
+            with self._lock:
+                for method, instance in self._replay:
+                    method(index, instance)
+                self.index = index
+                self._built_at = time.monotonic()
+        except Exception as e:
+            print(f"Search index rebuild failed: {e}")
+        finally:
+            with self._lock:
+                self._replay = None
+                self._rebuilding = False
+            # Every thread gets its own connection; don't leak it.
+            connection.close()
+
+    def build_index(self):
+        index = InvertedIndex()
+        for category in Category.objects.iterator():
+            self._add_category(index, category)
+        for page in Page.objects.iterator():
+            self._add_page(index, page)
+        return index
+
+    @staticmethod
+    def _add_page(index, page):
+        index.add(("page", page.id), tokenize(page.title) + url_tokens(page.url),
+                  {"title": page.title, "link": page.url, "summary": page.url}, page.views)
+
+    @staticmethod
+    def _add_category(index, category):
+        index.add(("category", category.id), tokenize(category.name),
+                  {"title": category.name,
+                   "link": reverse("rango:show_category", args=[category.slug]),
+                   "summary": f"Rango category with {category.likes} likes"},
+                  category.views)
+
+    def _index_saved(self, index, instance):
+        if isinstance(instance, Page):
+            self._add_page(index, instance)
+        elif isinstance(instance, Category):
+            self._add_category(index, instance)
+
+    @staticmethod
+    def _index_deleted(index, instance):
+        index.remove((instance._meta.model_name, instance.id))
+
+    def _apply(self, method, instance):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((method, instance))
+            # Nothing to update until the index has been built.
+            if self.index is not None:
+                method(self.index, instance)
+
+    def object_saved(self, instance):
+        self._apply(self._index_saved, instance)
+
+    def object_deleted(self, instance):
+        self._apply(self._index_deleted, instance)
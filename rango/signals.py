@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rango.bing_search import get_search_backend
+from rango import page_cache
+from rango.caching import bump_version
+from rango.category_cache import category_slugs
+from rango.models import Category, Page, UserProfile
+from rango.sqlite_tuning import apply_pragmas, tuning_enabled
+from rango.suggestions import CategoryEntry, category_index
+from rango.thumbnails import schedule_thumbnails
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # Creating, renaming or deleting a category changes the sidebar, and
+    # which slugs exist.
+    bump_version("categories")
+    category_slugs.clear()
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def page_changed(sender, instance, **kwargs):
+    # A category counts as modified when one of its pages is.
+    Category.objects.filter(id=instance.category_id).update(updated_at=timezone.now())
+    
+    # Pages are listed on their category's page and ranked on the home page.
+    page_cache.invalidate_rankings()
+    try:
+        page_cache.invalidate_categories([instance.category.slug])
+    except Category.DoesNotExist:
+        # Deleted along with its category, which bumped every page's version.
+        pass
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    category_index.add(CategoryEntry(instance.id, instance.name, instance.slug, instance.likes))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    category_index.remove(instance.id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Page)
+def search_object_saved(sender, instance, **kwargs):
+    get_search_backend().object_saved(instance)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Page)
+def search_object_deleted(sender, instance, **kwargs):
+    get_search_backend().object_deleted(instance)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def user_profile_changed(sender, instance, created=True, **kwargs):
+    # Only creating or deleting a profile changes the number of profiles.
+    if created:
+        bump_version("profiles")
+
+
+@receiver(post_save, sender=UserProfile)
+def user_profile_saved(sender, instance, **kwargs):
+    # New pictures get their thumbnails once the upload is committed.
+    if instance.picture and not instance.thumbnail_hash:
+        transaction.on_commit(lambda: schedule_thumbnails(instance.id))
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor == "sqlite" and tuning_enabled():
+        apply_pragmas(connection)
@@ -0,0 +1,39 @@
+from django.conf import settings
+
+
+# SQLite's defaults suit a single process. With several web workers, the
+# rollback journal makes every write block all readers, and a writer that
+# can't get the lock at once fails with "database is locked". In WAL mode
+# readers and the (single) writer don't block each other, and a busy
+# timeout makes writers queue for the lock instead of failing.
+
+DEFAULT_PRAGMAS = {
+    # Readers keep reading while a write is in progress. Persistent: it is
+    # stored in the database file.
+    "journal_mode": "wal",
+    # In WAL mode, syncing at checkpoints only is still safe from corruption;
+    # a power cut can lose the last transactions, not the database.
+    "synchronous": "normal",
+    # Milliseconds a connection waits for a lock before giving up.
+    "busy_timeout": 5000,
+    # Page cache per connection, in KiB when negative (64 MiB).
+    "cache_size": -64000,
+    # Read the database through a shared memory map (256 MiB).
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "memory",
+}
+
+
+def tuning_enabled():
+    return getattr(settings, "RANGO_SQLITE_TUNING", False)
+
+
+def sqlite_pragmas():
+    return getattr(settings, "RANGO_SQLITE_PRAGMAS", DEFAULT_PRAGMAS)
+
+
+def apply_pragmas(connection):
+    """Applies the configured pragmas to a new SQLite connection."""
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
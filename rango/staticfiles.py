@@ -0,0 +1,139 @@
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import Http404
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+from rango.media import file_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# collectstatic is the build step: with RangoStaticFilesStorage it
+#
+#   1. concatenates the files of each bundle in RANGO_STATIC_BUNDLES,
+#   2. gives every file a content-hashed name and writes staticfiles.json,
+#   3. writes .gz (and, if the brotli package is installed, .br) siblings
+#      of the hashed text files,
+#
+# so the base template loads one script and one stylesheet that browsers can
+# cache forever, and serve_static can send them precompressed.
+
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html", ".ico")
+
+# Smaller files don't get any smaller.
+MIN_COMPRESS_SIZE = 256
+
+
+def static_bundles():
+    return getattr(settings, "RANGO_STATIC_BUNDLES", {})
+
+
+def encodings():
+    """The precompressed variants, preferred first, as (encoding, suffix)."""
+    if brotli is not None:
+        return [("br", ".br"), ("gzip", ".gz")]
+    return [("gzip", ".gz")]
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output the same from one build to the next.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class RangoStaticFilesStorage(ManifestStaticFilesStorage):
+    bundles_enabled = True
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+
+        for name, sources in static_bundles().items():
+            self.build_bundle(name, sources)
+            paths[name] = (self, name)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        # Files referencing others are rewritten on every pass; only the
+        # final versions are in the manifest.
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if hashed_name.endswith(COMPRESSIBLE):
+                self.compress_file(hashed_name)
+
+    def build_bundle(self, name, sources):
+        parts = []
+        for source in sources:
+            with self.open(source) as f:
+                parts.append(f.read().rstrip())
+        # A newline alone isn't enough between scripts that omit their last
+        # semicolon.
+        separator = b"\n;\n" if name.endswith(".js") else b"\n"
+        if self.exists(name):
+            self.delete(name)
+        self.save(name, ContentFile(separator.join(parts) + b"\n"))
+
+    def compress_file(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        for encoding, suffix in encodings():
+            compressed = compress(data, encoding)
+            if len(compressed) < len(data):
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self.save(name + suffix, ContentFile(compressed))
+
+
+ACCEPT_ENCODING = re.compile(r"([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for match in ACCEPT_ENCODING.finditer(header.lower()):
+        encoding, quality = match.groups()
+        try:
+            if quality is None or float(quality) > 0:
+                accepted.add(encoding)
+        except ValueError:
+            pass
+    return accepted
+
+
+@require_safe
+def serve_static(request, path):
+    """
+    Serves collected static files, picking a precompressed variant when the
+    client accepts it.
+    """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found.")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found.")
+
+    accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    for encoding, suffix in encodings():
+        if (encoding in accepted or "*" in accepted) and os.path.isfile(full_path + suffix):
+            content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+            response = file_response(request, full_path + suffix, content_type=content_type)
+            response["Content-Encoding"] = encoding
+            break
+    else:
+        response = file_response(request, full_path)
+    if full_path.endswith(COMPRESSIBLE):
+        response["Vary"] = "Accept-Encoding"
+    return response
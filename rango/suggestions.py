@@ -0,0 +1,311 @@
+import heapq
+import json
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+
+from rango.caching import SingleFlight, TTLLRUCache
+from rango.models import Category
+
+
+CategoryEntry = namedtuple("CategoryEntry", ["id", "name", "slug", "likes"])
+
+# Sorts after every character, so (prefix + _MAX_CHAR,) bounds a prefix range.
+_MAX_CHAR = "\U0010ffff"
+
+
+def _rank(entry):
+    return (-entry.likes, entry.name)
+
+
+def _rerank(ranking, old, new, limit):
+    """
+    Returns a copy of ranking with entry old, whose likes have changed,
+    replaced by new; or None if that can't be told without the entries that
+    the limit cut off.
+    """
+    cut = limit is not None and len(ranking) >= limit
+    position = next((i for i, entry in enumerate(ranking) if entry.id == old.id), None)
+    if position is None:
+        if not cut or not ranking or _rank(new) >= _rank(ranking[-1]):
+            return ranking
+        # It climbs into the ranking and pushes the last one out.
+        ranking = ranking[:-1]
+    else:
+        ranking = ranking[:position] + ranking[position + 1:]
+    ranks = [_rank(entry) for entry in ranking]
+    position = bisect_left(ranks, _rank(new))
+    if cut and position == len(ranking) and _rank(new) > _rank(old):
+        # It fell to the end, where a category that was cut off may beat it.
+        return None
+    return ranking[:position] + [new] + ranking[position:]
+
+
+class CategoryPrefixIndex:
+    """
+    Per-process, case-insensitive prefix index over category names.
+    Names are kept in a sorted array, so the categories starting with a prefix
+    are found with two binary searches and only that range is ranked by likes.
+    The index is built lazily from the database and rebuilt after max_age
+    seconds, which picks up changes made by other processes. Rebuilds run in
+    a background thread and the new index is swapped in whole, so requests
+    keep being answered from the old one meanwhile; changes made in this
+    process during the rebuild are replayed onto the new index.
+
+    Rankings are computed outside the index lock, from a copy of the entries
+    in range. A change of likes doesn't discard them: the rankings it
+    affects are patched in place where possible, and only dropped when the
+    category falls down one that was cut off at a limit.
+    """
+
+    # Ranking a range this large is cached until the index next changes, so
+    # one and two letter prefixes stay cheap on big tables.
+    MEMO_THRESHOLD = 256
+
+    def __init__(self, loader=None, max_age=None):
+        self._loader = loader or self._load_from_database
+        self._max_age = max_age
+        self._lock = threading.RLock()
+        self._keys = []
+        self._entries = {}
+        # Rankings of wide prefixes, and of the whole table (prefix None),
+        # by (prefix, limit).
+        self._memo = {}
+        self._built_at = None
+        self._generation = 0
+        # Moves on every change, likes included, so a ranking computed from
+        # entries that have changed since isn't memoised.
+        self._changes = 0
+        # Only one thread loads the table at a time.
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        # Changes made while a build is loading, to replay onto its result.
+        self._replay = None
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        return getattr(settings, "RANGO_SUGGEST_INDEX_MAX_AGE", 60)
+
+    @staticmethod
+    def _load_from_database():
+        return (CategoryEntry(*row) for row in
+                Category.objects.values_list("id", "name", "slug", "likes").iterator())
+
+    def build(self, entries=None):
+        with self._build_lock:
+            self._build(entries)
+
+    def _build(self, entries):
+        with self._lock:
+            self._replay = []
+        try:
+            if entries is None:
+                entries = self._loader()
+            # Loading and sorting happen outside the index lock.
+            entries = {entry.id: entry for entry in entries}
+            keys = sorted((entry.name.lower(), entry.id) for entry in entries.values())
+        except BaseException:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self._entries = entries
+            self._keys = keys
+            self._built_at = time.monotonic()
+            for method, args in replay:
+                method(*args)
+            self._changed()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def is_built(self):
+        return self._built_at is not None
+
+    def _ensure_built(self):
+        # Called without the index lock held.
+        built_at = self._built_at
+        if built_at is None:
+            # Nothing to answer from yet: the first request waits for the build.
+            with self._build_lock:
+                if self._built_at is None:
+                    self._build(None)
+        elif time.monotonic() - built_at > self.max_age:
+            with self._lock:
+                if self._rebuilding:
+                    return
+                self._rebuilding = True
+            threading.Thread(target=self._rebuild_in_thread, daemon=True).start()
+
+    def _rebuild_in_thread(self):
+        try:
+            self.build()
+        except Exception as e:
+            print(f"Category index rebuild failed: {e}")
+        finally:
+            with self._lock:
+                self._rebuilding = False
+            # Every thread gets its own connection; don't leak it.
+            connection.close()
+
+    def _changed(self):
+        self._memo = {}
+        self._generation += 1
+        self._changes += 1
+
+    def version(self):
+        """
+        A number that changes whenever categories are added, renamed or
+        removed. Changes of likes, which only reorder results, don't move it.
+        """
+        self._ensure_built()
+        with self._lock:
+            return self._generation
+
+    def _record(self, method, *args):
+        # Called with the lock held. Returns True if there is no index to
+        # change yet; the build in progress, if any, replays the change.
+        if self._replay is not None:
+            self._replay.append((method, args))
+        return self._built_at is None
+
+    def add(self, entry):
+        """Adds or replaces a category. Does nothing until the index is built."""
+        with self._lock:
+            if self._record(self.add, entry):
+                return
+            self._discard(entry.id)
+            self._entries[entry.id] = entry
+            insort(self._keys, (entry.name.lower(), entry.id))
+            self._changed()
+
+    def remove(self, category_id):
+        with self._lock:
+            if not self._record(self.remove, category_id):
+                self._discard(category_id)
+                self._changed()
+
+    def update_likes(self, category_id, likes):
+        with self._lock:
+            self._record(self.update_likes, category_id, likes)
+            entry = self._entries.get(category_id)
+            if entry is not None and entry.likes != likes:
+                updated = self._entries[category_id] = entry._replace(likes=likes)
+                self._changes += 1
+                name = updated.name.lower()
+                for memo_key, ranking in list(self._memo.items()):
+                    prefix, limit = memo_key
+                    if prefix is not None and not name.startswith(prefix):
+                        continue
+                    ranking = _rerank(ranking, entry, updated, limit)
+                    if ranking is None:
+                        del self._memo[memo_key]
+                    else:
+                        self._memo[memo_key] = ranking
+
+    def _discard(self, category_id):
+        entry = self._entries.pop(category_id, None)
+        if entry is not None:
+            position = bisect_left(self._keys, (entry.name.lower(), entry.id))
+            del self._keys[position]
+
+    def search(self, prefix, limit=None):
+        """
+        Returns the categories whose name starts with prefix (ignoring case),
+        most liked first. If limit is given, only the top limit are returned.
+        """
+        prefix = prefix.lower()
+        self._ensure_built()
+        with self._lock:
+            memo_key = (prefix, limit)
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+            low = bisect_left(self._keys, (prefix,))
+            high = bisect_left(self._keys, (prefix + _MAX_CHAR,), low)
+            matches = [self._entries[category_id] for name, category_id in self._keys[low:high]]
+            changes = self._changes
+        return self._ranked(memo_key if len(matches) > self.MEMO_THRESHOLD else None,
+                            matches, limit, changes)
+
+    def top(self, limit=None):
+        """Returns all categories (or the top limit), most liked first."""
+        self._ensure_built()
+        with self._lock:
+            memo_key = (None, limit)
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+            entries = list(self._entries.values())
+            changes = self._changes
+        return self._ranked(memo_key, entries, limit, changes)
+
+    def _ranked(self, memo_key, entries, limit, changes):
+        # Called without the index lock held.
+        if limit is None or len(entries) <= limit:
+            result = sorted(entries, key=_rank)
+        else:
+            result = heapq.nsmallest(limit, entries, key=_rank)
+        if memo_key is not None:
+            with self._lock:
+                if self._changes == changes:
+                    self._memo[memo_key] = result
+        return result
+
+    def __len__(self):
+        return len(self._entries)
+
+
+category_index = CategoryPrefixIndex()
+
+
+class SuggestionResponses:
+    """
+    Encoded JSON suggestion responses for the most recently asked prefixes.
+    Entries are keyed by the index version, so an added, renamed or removed
+    category is never hidden by the cache; a change of likes, which only
+    reorders the suggestions, shows once the entry expires. A prefix that isn't cached is computed by
+    one thread while concurrent requests for it wait and share the result.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._cache = None
+        self._flight = SingleFlight()
+
+    @property
+    def cache(self):
+        # Created on first use, so importing this module doesn't need settings.
+        if self._cache is None:
+            self._cache = TTLLRUCache(max_size=getattr(settings, "RANGO_SUGGEST_CACHE_SIZE", 4096),
+                                      ttl=getattr(settings, "RANGO_SUGGEST_CACHE_TTL", 5))
+        return self._cache
+
+    def get(self, prefix, limit=8):
+        key = (prefix.lower(), limit, self.index.version())
+        body = self.cache.get(key)
+        if body is None:
+            body = self._flight.do(key, lambda: self._encode(key, prefix, limit))
+        return body
+
+    def _encode(self, key, prefix, limit):
+        # Nothing to suggest for an empty or unmatched prefix: the page keeps
+        # (or restores) its own sidebar.
+        categories = self.index.search(prefix, limit) if prefix else []
+        body = json.dumps({"categories": [[c.name, c.slug] for c in categories]},
+                          separators=(",", ":")).encode("utf-8")
+        self.cache.set(key, body)
+        return body
+
+    def clear(self):
+        self.cache.clear()
+
+
+suggestion_responses = SuggestionResponses(category_index)
+
@@ -1,8 +1,60 @@
 from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rango.caching import cache_timeout, versioned_key
 from rango.models import Category
+from rango import thumbnails
+from rango.staticfiles import static_bundles
 
 register = template.Library()
 
+SIDEBAR_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_sidebar_categories():
+    # The sidebar is on every page, so the category list is cached and only
+    # rebuilt after a category has been created, renamed or deleted.
+    key = versioned_key("categories", "sidebar")
+    categories = cache.get(key)
+    if categories is None:
+        # Read from the primary: a replica may not have the change that
+        # bumped the version yet.
+        categories = list(Category.objects.using(DEFAULT_DB_ALIAS).values("name", "slug"))
+        cache.set(key, categories, cache_timeout(SIDEBAR_CACHE_TIMEOUT))
+    return categories
+
+
 @register.inclusion_tag("rango/categories.html")
 def get_category_list(current_category=None):
-    return {"categories":Category.objects.all(), "current_category":current_category}
\ No newline at end of file
+    return {"categories":get_sidebar_categories(), "current_category":current_category}
+
+
+
+@register.filter
+def thumbnail(profile, size):
+    return thumbnails.thumbnail_url(profile, int(size))
+
+
+@register.filter
+def webp_thumbnail(profile, size):
+    return thumbnails.thumbnail_url(profile, int(size), "webp")
+
+
+
+@register.simple_tag
+def static_bundle(name):
+    """
+    Links a bundle from RANGO_STATIC_BUNDLES: the built bundle when static
+    files are collected with RangoStaticFilesStorage, otherwise each of the
+    files it is made of.
+    """
+    if getattr(staticfiles_storage, "bundles_enabled", False):
+        urls = [static(name)]
+    else:
+        urls = [static(source) for source in static_bundles()[name]]
+    if name.endswith(".css"):
+        return format_html_join("\n", '<link href="{}" rel="stylesheet">', ((url,) for url in urls))
+    return format_html_join("\n", '<script src="{}"></script>', ((url,) for url in urls))
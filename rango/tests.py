@@ -1,3 +1,1800 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import requests
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rango.bing_search import (AsyncBingSearchClient, BingSearchClient, CircuitBreaker, CircuitOpenError, reset_search_backend,
+                               arun_query, httpx, run_query, search_cache)
+from rango import db_router, events, metrics, page_cache
+from rango.asgi import RangoASGIHandler
+from rango.bulk_loader import BulkLoader, generate_records, read_records, write_records
+from rango.caching import SingleFlight, TTLLRUCache, WorkerSnapshots, cache_timeout, check_shared_cache
+from rango.category_cache import category_slugs
+from rango.counters import ClickCounter, click_counter, increment_category_likes
+from rango.models import Category, CategoryLike, ClickEvent, EventCheckpoint, Page, UserProfile
+from rango.suggestions import CategoryEntry, CategoryPrefixIndex, category_index, suggestion_responses
+from rango.pagination import category_pages
+from rango.replication import copy_sqlite_database
+from rango.query_plans import explain, hot_queries, plan_problems
+from rango.search_backends import InvertedIndex, LocalSearchBackend, SearchBackend, tokenize, url_tokens
+from rango.staticfiles import serve_static
+from rango.templatetags.rango_template_tags import get_sidebar_categories
+from rango.trending import Trending, TrendingWindow, trending
+from rango.thumbnails import make_thumbnails, schedule_thumbnails, thumbnail_name, update_thumbnails
+
+
+class RangoTestMixin:
+    def setUp(self):
+        # Rolled back test data doesn't fire the invalidation signals.
+        cache.clear()
+        category_index.invalidate()
+        reset_search_backend()
+        trending.clear()
+        category_slugs.clear()
+        click_counter.discard()
+
+
+class RangoTestCase(RangoTestMixin, TestCase):
+    pass
+
+
+class StubSearchServer:
+    """
+    A local stand-in for the Bing search API. Answers every query with two
+    results derived from the query terms and records the queries and the
+    client connections it saw.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.connections = set()
+        self.status = 200
+        self.delay = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+                stub.queries.append(query)
+                stub.connections.add(self.client_address)
+                time.sleep(stub.delay)
+                body = json.dumps({"webPages": {"value": [
+                    {"name": f"{query} {i}", "url": f"http://example.com/{i}", "snippet": query}
+                    for i in range(2)]}}).encode("utf-8")
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        # Clients that time out hang up mid-response; that is expected.
+        self.server.handle_error = lambda request, client_address: None
+        self.url = f"http://127.0.0.1:{self.server.server_port}/search"
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_category(name, views=0, likes=0):
+    return Category.objects.create(name=name, views=views, likes=likes)
+
+
+def add_page(category, title, url="http://www.example.com/", views=0):
+    return Page.objects.create(category=category, title=title, url=url, views=views)
+
+
+class ClickCounterTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = add_category("Python")
+        self.page = add_page(self.category, "Official Python Tutorial",
+                             url="http://docs.python.org/3/tutorial/", views=10)
+
+    def test_flush_writes_aggregated_clicks(self):
+        counter = ClickCounter(flush_size=1000, flush_interval=3600, background=False)
+        other = add_page(self.category, "Learn Python", views=0)
+        for i in range(3):
+            counter.record(self.page.id)
+        counter.record(other.id)
+
+        self.assertEqual(counter.flush(), 4)
+        self.page.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.page.views, 13)
+        self.assertEqual(other.views, 1)
+        self.assertEqual(counter.pending(), {})
+
+    def test_no_lost_increments_under_concurrent_clicks(self):
+        counter = ClickCounter(flush_size=10**9, flush_interval=3600, background=False)
+        threads = [threading.Thread(target=lambda: [counter.record(self.page.id) for i in range(500)])
+                   for t in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        counter.flush()
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.views, 10 + 8 * 500)
+
+    def test_flush_is_triggered_by_size(self):
+        counter = ClickCounter(flush_size=2, flush_interval=3600, background=False)
+        counter.record(self.page.id)
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.views, 10)
+
+        counter.record(self.page.id)
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.views, 12)
+
+    def test_idle_buffer_flushed_by_timer(self):
+        counter = ClickCounter(flush_size=1000, flush_interval=0.05, background=True)
+        flushed = threading.Event()
+        with mock.patch.object(counter, "flush", side_effect=lambda: flushed.set()):
+            counter.record(self.page.id)
+            self.assertTrue(flushed.wait(2))
+            # The timer keeps running; leave it nothing to write.
+            counter.discard()
+
+    def test_exit_flush_skips_other_databases(self):
+        counter = ClickCounter(flush_size=1000, flush_interval=3600, background=False)
+        counter.record(self.page.id)
+        with mock.patch.dict(connection.settings_dict, NAME="another.sqlite3"):
+            counter.flush_on_exit()
+        self.assertEqual(counter.pending(), {self.page.id: 1})
+        counter.flush_on_exit()
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.views, 11)
+
+    @override_settings(RANGO_CLICK_FLUSH_SIZE=1, RANGO_CLICK_FLUSH_BACKGROUND=False)
+    def test_goto_redirects_and_counts(self):
+        response = self.client.get(reverse("rango:goto"), {"page_id": self.page.id})
+        self.assertRedirects(response, "http://docs.python.org/3/tutorial/",
+                             fetch_redirect_response=False)
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.views, 11)
+
+    def test_goto_unknown_page(self):
+        for page_id in ("9999", "abc", ""):
+            response = self.client.get(reverse("rango:goto"), {"page_id": page_id})
+            self.assertRedirects(response, reverse("rango:index"))
+        self.assertEqual(click_counter.pending(), {})
+
+
+class LikeCategoryTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = add_category("Django", likes=32)
+        self.user = User.objects.create_user("rango", password="tango-with-django")
+        self.client.force_login(self.user)
+
+    def like(self, category_id):
+        return self.client.get(reverse("rango:like_category"), {"category_id": category_id})
+
+    def test_increment_returns_new_count(self):
+        self.assertEqual(increment_category_likes(self.category.id), 33)
+        self.assertIsNone(increment_category_likes(9999))
+
+    def test_like_once_per_user(self):
+        self.assertEqual(self.like(self.category.id).content, b"33")
+        self.assertEqual(self.like(self.category.id).content, b"33")
+
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.likes, 33)
+        self.assertEqual(CategoryLike.objects.filter(user=self.user).count(), 1)
+
+    def test_like_does_not_rewrite_category(self):
+        Category.objects.filter(id=self.category.id).update(slug="kept-as-is")
+        self.like(self.category.id)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.slug, "kept-as-is")
+
+    def test_like_bad_category(self):
+        for category_id in ("9999", "abc", ""):
+            self.assertEqual(self.like(category_id).content, b"-1")
+        self.assertFalse(CategoryLike.objects.exists())
+
+
+class SidebarCacheTests(RangoTestCase):
+    def test_sidebar_is_cached(self):
+        add_category("Python")
+        self.client.get(reverse("rango:about"))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_sidebar_categories(), [{"name": "Python", "slug": "python"}])
+
+    def test_sidebar_invalidated_by_category_changes(self):
+        python = add_category("Python")
+        self.assertEqual(len(get_sidebar_categories()), 1)
+
+        django = add_category("Django")
+        self.assertEqual(len(get_sidebar_categories()), 2)
+
+        django.name = "Django Rocks"
+        django.save()
+        self.assertIn({"name": "Django Rocks", "slug": "django-rocks"}, get_sidebar_categories())
+
+        python.delete()
+        self.assertEqual(get_sidebar_categories(), [{"name": "Django Rocks", "slug": "django-rocks"}])
+
+    def test_timeout_capped_without_a_shared_cache(self):
+        add_category("Python")
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            get_sidebar_categories()
+        self.assertEqual(cache_set.call_args[0][2], 5)
+        self.assertEqual([message.id for message in check_shared_cache(None)], ["rango.W001"])
+
+        with override_settings(CACHES={"default": {
+                "BACKEND": "django.core.cache.backends.memcached.MemcachedCache"}}):
+            self.assertEqual(cache_timeout(60 * 60), 60 * 60)
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_active_category_highlighted(self):
+        add_category("Python")
+        add_category("Django")
+        response = self.client.get(reverse("rango:show_category", args=["django"]))
+        self.assertContains(response, 'class="nav-link active" href="/rango/category/django/"')
+        self.assertContains(response, 'class="nav-link" href="/rango/category/python/"')
+
+
+class CategoryPrefixIndexTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = CategoryPrefixIndex(loader=lambda: [
+            CategoryEntry(1, "Python", "python", 64),
+            CategoryEntry(2, "Pascal", "pascal", 2),
+            CategoryEntry(3, "PHP", "php", 9),
+            CategoryEntry(4, "Perl", "perl", 1),
+            CategoryEntry(5, "Django", "django", 32),
+        ], max_age=3600)
+
+    def names(self, entries):
+        return [entry.name for entry in entries]
+
+    def test_search_is_case_insensitive_and_ranked_by_likes(self):
+        self.assertEqual(self.names(self.index.search("p")), ["Python", "PHP", "Pascal", "Perl"])
+        self.assertEqual(self.names(self.index.search("PA")), ["Pascal"])
+        self.assertEqual(self.index.search("x"), [])
+
+    def test_search_limit(self):
+        self.assertEqual(self.names(self.index.search("p", limit=2)), ["Python", "PHP"])
+
+    def test_top(self):
+        self.assertEqual(self.names(self.index.top(3)), ["Python", "Django", "PHP"])
+
+    def test_incremental_updates(self):
+        self.index.build()
+        self.index.add(CategoryEntry(5, "Pyramid", "pyramid", 100))
+        self.index.remove(1)
+        self.index.update_likes(3, 1000)
+        self.assertEqual(self.names(self.index.search("p")), ["PHP", "Pyramid", "Pascal", "Perl"])
+        self.assertEqual(self.index.search("d"), [])
+
+    def test_likes_patch_rankings_in_place(self):
+        self.index.build()
+        self.assertEqual(self.names(self.index.top(2)), ["Python", "Django"])
+        version = self.index.version()
+
+        with mock.patch("rango.suggestions.heapq.nsmallest") as nsmallest:
+            # Climbs into the top two, then moves within it.
+            self.index.update_likes(3, 40)
+            self.assertEqual(self.names(self.index.top(2)), ["Python", "PHP"])
+            self.index.update_likes(3, 100)
+            self.assertEqual(self.names(self.index.top(2)), ["PHP", "Python"])
+        nsmallest.assert_not_called()
+        self.assertEqual(self.index.version(), version)
+
+        # Falling to the end could let a category that was cut off past it.
+        self.index.update_likes(1, 0)
+        self.assertEqual(self.names(self.index.top(2)), ["PHP", "Django"])
+
+    def test_stale_index_rebuilt_in_the_background(self):
+        entries = [CategoryEntry(1, "Python", "python", 64)]
+        loading = threading.Event()
+        release = threading.Event()
+
+        def slow_loader():
+            loading.set()
+            release.wait(5)
+            return list(entries)
+
+        index = CategoryPrefixIndex(loader=slow_loader, max_age=0)
+        index.build(entries)
+        entries.append(CategoryEntry(2, "PyPy", "pypy", 100))
+        # Stale: the rebuild starts, but the old index answers meanwhile.
+        self.assertEqual(self.names(index.search("py")), ["Python"])
+        self.assertTrue(loading.wait(2))
+        index.update_likes(1, 200)
+        self.assertEqual(self.names(index.search("py")), ["Python"])
+
+        index._max_age = 3600
+        release.set()
+        for i in range(100):
+            if len(index) == 2:
+                break
+            time.sleep(0.01)
+        # The like made during the rebuild was replayed onto the new index.
+        self.assertEqual(self.names(index.search("py")), ["Python", "PyPy"])
+
+    def test_index_follows_category_signals(self):
+        python = add_category("Python", likes=64)
+        self.assertEqual(self.names(category_index.search("py")), ["Python"])
+
+        add_category("PyPy", likes=100)
+        python.name = "Snake"
+        python.save()
+        self.assertEqual(self.names(category_index.search("py")), ["PyPy"])
+        self.assertEqual(self.names(category_index.search("sn")), ["Snake"])
+
+    def test_suggest_view_served_from_memory(self):
+        add_category("Python", likes=64)
+        add_category("Perl", likes=1)
+        category_index.build()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("rango:suggest"), {"suggestion": "py"})
+        self.assertContains(response, "Python")
+        self.assertNotContains(response, "Perl")
+
+        # Nothing matches: fall back to the most liked categories.
+        for i in range(10):
+            add_category(f"Category {i}", likes=10 + i)
+        response = self.client.get(reverse("rango:suggest"), {"suggestion": "zzz"})
+        self.assertContains(response, "Python")
+        self.assertContains(response, "Category 9")
+        self.assertNotContains(response, "Perl")
+
+
+class TTLLRUCacheTests(RangoTestCase):
+    def test_lru_eviction(self):
+        lru = TTLLRUCache(max_size=2, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.stats(), {"hits": 2, "misses": 1, "size": 2})
+
+    def test_ttl_expiry(self):
+        now = [0]
+        lru = TTLLRUCache(max_size=2, ttl=10, clock=lambda: now[0])
+        lru.set("a", 1)
+        now[0] = 9
+        self.assertEqual(lru.get("a"), 1)
+        now[0] = 10
+        self.assertIsNone(lru.get("a"))
+
+
+class SearchCacheTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        search_cache.clear()
+        self.stub = StubSearchServer().__enter__()
+        self.addCleanup(self.stub.__exit__)
+        self.settings_override = override_settings(BING_SEARCH_URL=self.stub.url, BING_API_KEY="test-key",
+                                                   BING_MAX_RETRIES=0)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_repeated_query_is_cached(self):
+        first = run_query("Django Forms")
+        self.assertEqual(first[0], {"title": "Django Forms 0", "link": "http://example.com/0",
+                                    "summary": "Django Forms"})
+        self.assertEqual(run_query("  django   forms "), first)
+        self.assertEqual(self.stub.queries, ["Django Forms"])
+        self.assertEqual(search_cache.stats()["hits"], 1)
+        self.assertEqual(search_cache.stats()["misses"], 1)
+
+    def test_failures_are_not_cached(self):
+        self.stub.status = 500
+        self.assertEqual(run_query("django"), [])
+        self.stub.status = 200
+        self.assertEqual(len(run_query("django")), 2)
+        self.assertEqual(len(self.stub.queries), 2)
+
+    @override_settings(RANGO_SEARCH_CACHE_ALIAS="default")
+    def test_shared_backend(self):
+        run_query("tango")
+        # Another worker has an empty local cache but shares the backend.
+        search_cache.local.clear()
+        self.assertEqual(len(run_query("tango")), 2)
+        self.assertEqual(self.stub.queries, ["tango"])
+        self.assertEqual(search_cache.stats()["shared_hits"], 1)
+
+
+class BingSearchClientTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stub = StubSearchServer().__enter__()
+        self.addCleanup(self.stub.__exit__)
+
+    def client_for_stub(self, **kwargs):
+        kwargs.setdefault("backoff_factor", 0)
+        client = BingSearchClient(search_url=self.stub.url, api_key="test-key", **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_connections_are_reused(self):
+        client = self.client_for_stub()
+        for query in ("python", "django", "tango"):
+            self.assertEqual(len(client.search(query)), 2)
+        self.assertEqual(len(self.stub.connections), 1)
+
+    def test_read_timeout(self):
+        self.stub.delay = 0.5
+        client = self.client_for_stub(read_timeout=0.1, max_retries=0)
+        start = time.monotonic()
+        with self.assertRaises(requests.RequestException):
+            client.search("slow")
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_server_errors_are_retried(self):
+        self.stub.status = 503
+        client = self.client_for_stub(max_retries=2)
+        with self.assertRaises(requests.HTTPError):
+            client.search("down")
+        self.assertEqual(len(self.stub.queries), 3)
+
+    def test_circuit_breaker_fails_fast(self):
+        self.stub.status = 500
+        client = self.client_for_stub(max_retries=0, failure_threshold=2, reset_timeout=60)
+        for i in range(2):
+            with self.assertRaises(requests.HTTPError):
+                client.search("down")
+        with self.assertRaises(CircuitOpenError):
+            client.search("down")
+        self.assertEqual(len(self.stub.queries), 2)
+
+    def test_circuit_breaker_half_open(self):
+        now = [0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 10
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+        # Only one trial call at a time.
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.is_open)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 20
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_circuit_breaker_abandoned_trial(self):
+        now = [0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 10
+        self.assertTrue(breaker.allow())
+        now[0] = 15
+        self.assertFalse(breaker.allow())
+        # The trial never reported back.
+        now[0] = 20
+        self.assertTrue(breaker.allow())
+
+    def test_run_query_returns_empty_list_when_circuit_is_open(self):
+        self.stub.status = 500
+        with override_settings(BING_SEARCH_URL=self.stub.url, BING_API_KEY="test-key",
+                               BING_MAX_RETRIES=0, BING_CIRCUIT_FAILURES=1):
+            search_cache.clear()
+            self.assertEqual(run_query("down"), [])
+            self.assertEqual(run_query("down"), [])
+        self.assertEqual(len(self.stub.queries), 1)
+
+
+class InvertedIndexTests(RangoTestCase):
+    def test_relevance_then_views(self):
+        index = InvertedIndex()
+        index.add(1, tokenize("Django Rocks"), "rocks", views=10)
+        index.add(2, tokenize("Official Django Tutorial"), "tutorial", views=1000)
+        index.add(3, tokenize("Django Django Django"), "spam", views=0)
+        index.add(4, tokenize("Flask"), "flask", views=10**6)
+
+        self.assertEqual(index.search("flask"), ["flask"])
+        self.assertEqual(index.search("django tutorial")[0], "tutorial")
+        self.assertNotIn("flask", index.search("django"))
+        self.assertEqual(index.search("bottle"), [])
+
+    def test_remove(self):
+        index = InvertedIndex()
+        index.add(1, tokenize("Django Rocks"), "rocks")
+        index.add(1, tokenize("Bottle"), "bottle")
+        self.assertEqual(index.search("django"), [])
+        index.remove(1)
+        self.assertEqual(index.search("bottle"), [])
+        self.assertEqual(len(index), 0)
+
+
+@override_settings(RANGO_SEARCH_BACKEND="rango.search_backends.LocalSearchBackend")
+class LocalSearchBackendTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.python = add_category("Python")
+        add_page(self.python, "Official Python Tutorial", url="http://docs.python.org/3/tutorial/", views=11)
+        add_page(self.python, "Learn Python in 10 Minutes",
+                 url="http://www.korokithakis.net/tutorials/python/", views=33)
+
+    def titles(self, query):
+        return [result["title"] for result in run_query(query)]
+
+    def test_searches_pages_and_categories(self):
+        self.assertEqual(self.titles("tutorial"), ["Official Python Tutorial"])
+        self.assertIn("Python", self.titles("python"))
+        self.assertEqual(self.titles("korokithakis"), ["Learn Python in 10 Minutes"])
+        self.assertEqual(run_query("korokithakis")[0]["link"], "http://www.korokithakis.net/tutorials/python/")
+
+    def test_common_url_parts_not_indexed(self):
+        self.assertEqual(url_tokens("http://www.korokithakis.net/tutorials/python/index.html"),
+                         ["korokithakis", "tutorials", "python", "index"])
+        self.assertEqual(self.titles("http www net org"), [])
+        self.assertEqual(self.titles("https://docs.python.org/3/tutorial/")[0], "Official Python Tutorial")
+
+    def test_index_updates_incrementally(self):
+        self.assertEqual(self.titles("flask"), [])
+        frameworks = add_category("Other Frameworks")
+        flask = add_page(frameworks, "Flask", url="http://flask.pocoo.org")
+        self.assertEqual(self.titles("flask"), ["Flask"])
+
+        flask.title = "Bottle"
+        flask.save()
+        self.assertEqual(self.titles("bottle"), ["Bottle"])
+
+        frameworks.delete()
+        self.assertEqual(self.titles("bottle"), [])
+        self.assertEqual(self.titles("frameworks"), [])
+
+    def test_stale_index_rebuilt(self):
+        backend = LocalSearchBackend(max_age=3600)
+        backend.search("python")
+        # Bulk updates don't fire the signals.
+        Page.objects.filter(title="Official Python Tutorial").update(title="Official Snake Tutorial")
+        self.assertEqual(backend.search("snake"), [])
+
+        # The rebuild runs in a thread; load the new index in this one, where
+        # the test's rows are visible.
+        fresh = backend.build_index()
+        backend._max_age = 0
+        with mock.patch.object(backend, "build_index", return_value=fresh):
+            backend.search("snake")
+            for i in range(100):
+                if backend.index is fresh:
+                    break
+                time.sleep(0.01)
+        backend._max_age = 3600
+        self.assertEqual([result["title"] for result in backend.search("snake")], ["Official Snake Tutorial"])
+
+    def test_search_is_served_from_memory(self):
+        run_query("python")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles("minutes"), ["Learn Python in 10 Minutes"])
+
+
+class AsyncOnlySearchBackend(SearchBackend):
+    cacheable = False
+
+    def search(self, search_terms):
+        raise AssertionError("The view must not search on its own thread.")
+
+    async def asearch(self, search_terms):
+        return [{"title": f"Async {search_terms}", "link": "http://example.com/", "summary": ""}]
+
+
+@override_settings(RANGO_SEARCH_BACKEND="rango.tests.AsyncOnlySearchBackend")
+class ASGIHandlerTests(RangoTestMixin, TransactionTestCase):
+    def request(self, method, path, body=b""):
+        token = "a" * 64
+        scope = {"type": "http", "method": method, "path": path, "query_string": b"",
+                 "http_version": "1.1", "headers": [(b"host", b"testserver"), (b"cookie", f"csrftoken={token}".encode()),
+                                                    (b"content-type", b"application/x-www-form-urlencoded")]}
+        body = body.replace(b"TOKEN", token.encode())
+        scope["headers"].append((b"content-length", str(len(body)).encode()))
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": body}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(RangoASGIHandler(get_wsgi_application())(scope, receive, send))
+        return messages[0]["status"], b"".join(m.get("body", b"") for m in messages[1:]).decode()
+
+    def test_search_runs_on_the_event_loop(self):
+        status, content = self.request("POST", reverse("rango:search"),
+                                       b"csrfmiddlewaretoken=TOKEN&query=python")
+        self.assertEqual(status, 200)
+        self.assertIn("Async python", content)
+
+    def test_other_requests_served(self):
+        status, content = self.request("GET", reverse("rango:about"))
+        self.assertEqual(status, 200)
+
+    def test_csrf_still_checked(self):
+        # A form without a token, or with one that doesn't match the cookie, is
+        # turned away without spending a search.
+        with mock.patch.object(AsyncOnlySearchBackend, "asearch") as asearch:
+            for body in (b"query=python", b"csrfmiddlewaretoken=" + b"a" * 32 + b"b" * 32 + b"&query=python"):
+                status, content = self.request("POST", reverse("rango:search"), body)
+                self.assertEqual(status, 403)
+        asearch.assert_not_called()
+
+
+@skipUnless(httpx, "httpx is not installed")
+class AsyncSearchTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        search_cache.clear()
+        self.stub = StubSearchServer().__enter__()
+        self.addCleanup(self.stub.__exit__)
+
+    def test_searches_run_concurrently(self):
+        self.stub.delay = 0.3
+
+        async def search_many():
+            client = AsyncBingSearchClient(search_url=self.stub.url, api_key="test-key")
+            try:
+                return await asyncio.gather(*[client.search(f"query {i}") for i in range(20)])
+            finally:
+                await client.close()
+
+        start = time.monotonic()
+        results = asyncio.run(search_many())
+        # Run one after the other, these would take 6 seconds.
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual([len(result) for result in results], [2] * 20)
+
+    def test_async_client_fails_like_sync_client(self):
+        self.stub.status = 500
+
+        async def search():
+            client = AsyncBingSearchClient(search_url=self.stub.url, api_key="test-key",
+                                           max_retries=1, backoff_factor=0, failure_threshold=1)
+            try:
+                with self.assertRaises(IOError):
+                    await client.search("down")
+                with self.assertRaises(CircuitOpenError):
+                    await client.search("down")
+            finally:
+                await client.close()
+
+        asyncio.run(search())
+        self.assertEqual(len(self.stub.queries), 2)
+
+    def test_arun_query_shares_the_cache(self):
+        with override_settings(BING_SEARCH_URL=self.stub.url, BING_API_KEY="test-key"):
+            results = asyncio.run(arun_query("tango"))
+            self.assertEqual(len(results), 2)
+            self.assertEqual(run_query("Tango"), results)
+        self.assertEqual(self.stub.queries, ["tango"])
+
+
+@override_settings(RANGO_SEARCH_BACKEND="rango.search_backends.LocalSearchBackend")
+class SearchViewTests(RangoTestCase):
+    def test_search(self):
+        python = add_category("Python")
+        add_page(python, "Official Python Tutorial", url="http://docs.python.org/3/tutorial/")
+        response = self.client.post(reverse("rango:search"), {"query": "tutorial"})
+        self.assertContains(response, "Official Python Tutorial")
+        self.assertContains(self.client.get(reverse("rango:search")), 'name="query"')
+
+
+class QueryPlanTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        Category.objects.bulk_create(
+            [Category(name=f"Category {i}", slug=f"category-{i}", likes=i) for i in range(50)])
+        categories = list(Category.objects.order_by("id"))
+        Page.objects.bulk_create([Page(category=categories[i % 50], title=f"Page {i}",
+                                       url=f"http://example.com/{i}", views=(i * 7919) % 1000)
+                                  for i in range(5000)])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.category_id = categories[0].id
+
+    def test_ranking_queries_use_an_index(self):
+        for name, queryset in hot_queries(self.category_id).items():
+            plan = explain(queryset)
+            self.assertEqual(plan_problems(plan), [], f"{name}: {plan}")
+
+    def test_command_defaults_to_the_largest_category(self):
+        largest = Category.objects.get(slug="category-7")
+        Page.objects.create(category=largest, title="One more", url="http://example.com/more")
+        with mock.patch("rango.management.commands.check_query_plans.hot_queries", return_value={}) as queries:
+            call_command("check_query_plans", stdout=io.StringIO())
+        queries.assert_called_once_with(largest.id)
+
+
+class BulkLoaderTests(RangoTestCase):
+    records = [
+        {"category": "Python", "views": 128, "likes": 64},
+        {"category": "Python", "title": "Official Python Tutorial",
+         "url": "http://docs.python.org/3/tutorial/", "views": 11},
+        {"category": "Django", "title": "Django Rocks", "url": "http://www.djangorocks.com/", "views": 55},
+        {"category": "Python", "title": "Learn Python in 10 Minutes",
+         "url": "http://www.korokithakis.net/tutorials/python/", "views": 33},
+    ]
+
+    def test_load_in_batches(self):
+        # One lookup of existing categories, then per batch a savepoint pair,
+        # one insert and one lookup for categories, one lookup and one insert for pages,
+        # and one update marking the pages' categories as modified.
+        with self.assertNumQueries(8):
+            loader = BulkLoader(batch_size=10).load(self.records)
+        self.assertEqual(loader.created, {"categories": 2, "pages": 3})
+
+        python = Category.objects.get(name="Python")
+        self.assertEqual((python.slug, python.views, python.likes), ("python", 128, 64))
+        self.assertEqual(Category.objects.get(name="Django").likes, 0)
+        self.assertEqual(list(Page.objects.filter(category=python).order_by("views").values_list("title", flat=True)),
+                         ["Official Python Tutorial", "Learn Python in 10 Minutes"])
+
+    def test_load_updates_existing_rows(self):
+        BulkLoader(batch_size=2).load(self.records)
+        loader = BulkLoader(batch_size=2).load([
+            {"category": "Python", "views": 1, "likes": 2},
+            {"category": "Python", "title": "Official Python Tutorial",
+             "url": "http://docs.python.org/3/tutorial/", "views": 12},
+            {"category": "Python", "title": "Official Python Tutorial",
+             "url": "http://docs.python.org/3/tutorial/", "views": 13},
+        ])
+        self.assertEqual(loader.created, {"categories": 0, "pages": 0})
+        self.assertEqual(Page.objects.count(), 3)
+        self.assertEqual(Page.objects.get(title="Official Python Tutorial").views, 13)
+        self.assertEqual(Category.objects.get(name="Python").likes, 2)
+
+    def test_missing_counts_left_alone(self):
+        BulkLoader().load(self.records)
+        BulkLoader().load([
+            {"category": "Python", "views": 1},
+            {"category": "Python", "title": "Official Python Tutorial", "url": "http://docs.python.org/3.12/tutorial/"},
+        ])
+        python = Category.objects.get(name="Python")
+        self.assertEqual((python.views, python.likes), (1, 64))
+        page = Page.objects.get(title="Official Python Tutorial")
+        self.assertEqual((page.url, page.views), ("http://docs.python.org/3.12/tutorial/", 11))
+
+    def test_load_invalidates_sidebar(self):
+        self.assertEqual(get_sidebar_categories(), [])
+        BulkLoader().load(self.records)
+        self.assertEqual(len(get_sidebar_categories()), 2)
+
+    def test_load_invalidates_cached_pages(self):
+        BulkLoader().load(self.records)
+        index = self.client.get(reverse("rango:index"))
+        self.client.get(reverse("rango:show_category", args=["python"]))
+        self.assertEqual(category_slugs.get("python").views, 128)
+        self.assertEqual([c.name for c in category_index.search("py")], ["Python"])
+
+        BulkLoader().load([
+            {"category": "Python", "views": 129, "likes": 65},
+            {"category": "Python", "title": "Python Weekly", "url": "http://www.pythonweekly.com/", "views": 5},
+            {"category": "Pyramid"},
+        ])
+        self.assertNotEqual(self.client.get(reverse("rango:index")).content, index.content)
+        self.assertContains(self.client.get(reverse("rango:show_category", args=["python"])), "Python Weekly")
+        self.assertEqual(category_slugs.get("python").views, 129)
+        self.assertEqual([c.name for c in category_index.search("py")], ["Python", "Pyramid"])
+
+    def test_read_and_write_files(self):
+        directory = tempfile.mkdtemp()
+        for name in ("data.jsonl", "data.csv"):
+            path = os.path.join(directory, name)
+            write_records(self.records, path)
+            records = [{key: str(value) for key, value in record.items()} for record in read_records(path)]
+            self.assertEqual(records, [{key: str(value) for key, value in record.items()}
+                                       for record in self.records])
+            os.remove(path)
+        os.rmdir(directory)
+
+    def test_generate(self):
+        records = list(generate_records(10, 1000, seed=1))
+        self.assertEqual(records, list(generate_records(10, 1000, seed=1)))
+        self.assertEqual(len(records), 1010)
+
+        BulkLoader(upsert=False).load(records)
+        self.assertEqual(Page.objects.count(), 1000)
+        # Zipf: the first category holds far more pages than the last.
+        counts = [Page.objects.filter(category__name=f"Category {i:02d}").count() for i in (0, 9)]
+        self.assertGreater(counts[0], 3 * counts[1])
+
+
+class PageListingTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = add_category("Python")
+        # Lots of ties on views, as in real data.
+        Page.objects.bulk_create([Page(category=self.category, title=f"Page {i}",
+                                       url=f"http://example.com/{i}", views=i % 4) for i in range(23)])
+        self.expected = list(Page.objects.filter(category=self.category)
+                             .order_by("-views", "-id").values_list("id", flat=True))
+
+    def test_cursor_walks_every_page_once_in_order(self):
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1 if cursor is None else 2):
+                pages, cursor = category_pages(self.category.id, cursor, limit=5)
+            seen.extend(page.id for page in pages)
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_bad_cursor_starts_from_the_top(self):
+        pages, cursor = category_pages(self.category.id, "not-a-cursor", limit=3)
+        self.assertEqual([page.id for page in pages], self.expected[:3])
+
+    def test_show_category_and_load_more(self):
+        response = self.client.get(reverse("rango:show_category", args=["python"]))
+        self.assertEqual(len(response.context["pages"]), 5)
+        cursor = response.context["next_cursor"]
+        self.assertContains(response, f"/rango/category/python/pages/?cursor={cursor}")
+
+        response = self.client.get(reverse("rango:page_listing", args=["python"]), {"cursor": cursor})
+        self.assertEqual([page.id for page in response.context["pages"]], self.expected[5:10])
+        self.assertContains(response, "rango-load-more")
+
+        response = self.client.get(reverse("rango:page_listing", args=["missing"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_add_page_returns_first_batch(self):
+        self.client.force_login(User.objects.create_user("rango", password="tango-with-django"))
+        response = self.client.get(reverse("rango:search_add_page"), {
+            "category_id": self.category.id, "title": "Flask", "url": "http://flask.pocoo.org"})
+        self.assertEqual(len(response.context["pages"]), 5)
+        self.assertTrue(Page.objects.filter(title="Flask").exists())
+
+
+@override_settings(RANGO_PROFILE_LISTING_SIZE=10)
+class ListProfilesTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user("rango", password="tango-with-django"))
+
+    def add_profiles(self, count):
+        for i in range(count):
+            UserProfile.objects.create(user=User.objects.create_user(f"user{UserProfile.objects.count()}"))
+
+    def count_queries(self, **params):
+        # Warm the cached sidebar and profile count, as in production.
+        self.client.get(reverse("rango:list_profiles"), params)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("rango:list_profiles"), params)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.add_profiles(3)
+        small, response = self.count_queries()
+        self.assertEqual(len(response.context["user_profile_list"]), 3)
+
+        self.add_profiles(40)
+        large, response = self.count_queries()
+        self.assertEqual(len(response.context["user_profile_list"]), 10)
+        self.assertEqual(small, large)
+        # Session, user and one query for the profiles with their users.
+        self.assertEqual(large, 3)
+
+    def test_pages_through_profiles(self):
+        self.add_profiles(25)
+        usernames = []
+        params = {}
+        while True:
+            response = self.client.get(reverse("rango:list_profiles"), params)
+            usernames.extend(profile.user.username for profile in response.context["user_profile_list"])
+            if response.context["next_after"] is None:
+                break
+            params = {"after": response.context["next_after"]}
+        self.assertEqual(usernames, [f"user{i}" for i in range(25)])
+        self.assertContains(response, "25 users on Rango")
+
+    def test_count_is_cached_and_invalidated(self):
+        self.add_profiles(2)
+        self.assertContains(self.client.get(reverse("rango:list_profiles")), "2 users on Rango")
+        self.add_profiles(1)
+        self.assertContains(self.client.get(reverse("rango:list_profiles")), "3 users on Rango")
+
+
+class MetricsTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+
+    def test_registry_sums_thread_shards(self):
+        registry = metrics.MetricsRegistry()
+        threads = [threading.Thread(target=lambda: [registry.observe("rango:index", 0.002, queries=3)
+                                                    for i in range(100)]) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        registry.observe("rango:index", 20)
+
+        stats = registry.snapshot()["rango:index"]
+        self.assertEqual(stats["requests"], 401)
+        self.assertEqual(stats["queries"], 1200)
+        self.assertEqual(stats["buckets"][0], 400)
+        self.assertEqual(stats["buckets"][-1], 1)
+
+    def test_middleware_records_by_view_name(self):
+        python = add_category("Python")
+        add_page(python, "Official Python Tutorial")
+        self.client.get(reverse("rango:show_category", args=["python"]))
+        self.client.get(reverse("rango:show_category", args=["python"]))
+        self.client.get("/no/such/page/")
+
+        snapshot = metrics.registry.snapshot()
+        stats = snapshot["rango:show_category"]
+        self.assertEqual(stats["requests"], 2)
+        self.assertGreater(stats["queries"], 0)
+        self.assertGreater(stats["template_time"], 0)
+        self.assertGreaterEqual(stats["latency"], stats["template_time"])
+        self.assertEqual(snapshot["unresolved"]["requests"], 1)
+
+    def test_metrics_endpoint_and_command(self):
+        self.client.get(reverse("rango:index"))
+        User.objects.create_user("admin", password="secret", is_staff=True)
+        self.client.login(username="admin", password="secret")
+        response = self.client.get(reverse("rango:metrics"))
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertContains(response, 'rango_request_duration_seconds_count{view="rango:index"} 1')
+        self.assertContains(response, 'rango_db_queries_total{view="rango:index"}')
+
+        out = io.StringIO()
+        call_command("rango_metrics", stdout=out)
+        self.assertIn("rango:index", out.getvalue())
+
+    @override_settings(RANGO_METRICS_TOKEN="s3cret")
+    def test_endpoint_needs_staff_or_token(self):
+        url = reverse("rango:metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        User.objects.create_user("user", password="secret")
+        self.client.login(username="user", password="secret")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+    def test_workers_publish_side_by_side(self):
+        metrics.registry.observe("rango:index", 0.01)
+        metrics.publish()
+        # Another worker, racing this one to publish.
+        other = WorkerSnapshots("metrics")
+        other.publish({"rango:index": dict(metrics.empty_stats(), requests=2)}, 60)
+        metrics.publish()
+        self.assertEqual(metrics.collect()["rango:index"]["requests"], 3)
+
+
+class VisitTrackingTests(RangoTestCase):
+    def session_writes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return [query["sql"] for query in queries
+                if "django_session" in query["sql"] and query["sql"].startswith(("INSERT", "UPDATE"))]
+
+    def set_session(self, **values):
+        session = self.client.session
+        session.update(values)
+        session.save()
+
+    def test_session_written_once_per_day(self):
+        self.assertEqual(len(self.session_writes(reverse("rango:index"))), 1)
+        self.assertEqual(self.session_writes(reverse("rango:index")), [])
+        self.assertEqual(self.session_writes(reverse("rango:about")), [])
+        self.assertEqual(self.client.session["visits"], 1)
+        self.assertIsInstance(self.client.session["last_visit"], int)
+
+    def test_visit_counted_after_a_day(self):
+        self.set_session(visits=4, last_visit=int(time.time()) - 25 * 60 * 60)
+        response = self.client.get(reverse("rango:about"))
+        self.assertContains(response, "Visits: 5")
+        self.assertEqual(self.client.get(reverse("rango:about")).context["visits"], 5)
+
+    def test_old_datetime_strings_are_converted(self):
+        self.set_session(visits=2, last_visit="2020-02-04 18:10:00.123456")
+        self.assertContains(self.client.get(reverse("rango:about")), "Visits: 3")
+        self.assertIsInstance(self.client.session["last_visit"], int)
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_signed_cookie_sessions(self):
+        self.client.get(reverse("rango:index"))
+        response = self.client.get(reverse("rango:index"))
+        # An unmodified session doesn't send the cookie again.
+        self.assertNotIn("sessionid", response.cookies)
+        self.assertContains(self.client.get(reverse("rango:about")), "Visits: 1")
+
+
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+class AnonymousPageCacheTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.python = add_category("Python", likes=64)
+        self.page = add_page(self.python, "Official Python Tutorial", views=11)
+
+    def get(self, url):
+        return self.client.get(url).content.decode()
+
+    def test_cache_hits_touch_no_database(self):
+        for url in (reverse("rango:index"), reverse("rango:show_category", args=["python"])):
+            first = self.get(url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(url), first)
+
+    def test_visits_still_counted_on_cache_hits(self):
+        self.client.get(reverse("rango:index"))
+        self.client.get(reverse("rango:index"))
+        self.assertEqual(self.client.session["visits"], 1)
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.client.get(reverse("rango:show_category", args=["python"]))
+        self.client.force_login(User.objects.create_user("rango", password="tango-with-django"))
+        self.assertIn("like_btn", self.get(reverse("rango:show_category", args=["python"])))
+
+    def test_invalidated_by_new_pages(self):
+        self.get(reverse("rango:index"))
+        self.get(reverse("rango:show_category", args=["python"]))
+        add_page(self.python, "Learn Python in 10 Minutes", views=100)
+        self.assertIn("Learn Python in 10 Minutes", self.get(reverse("rango:index")))
+        self.assertIn("Learn Python in 10 Minutes", self.get(reverse("rango:show_category", args=["python"])))
+
+    def test_invalidated_by_clicks_and_likes(self):
+        add_category("Django")
+        self.get(reverse("rango:show_category", args=["python"]))
+        django_page = self.get(reverse("rango:show_category", args=["django"]))
+
+        counter = ClickCounter(flush_size=1, background=False)
+        counter.record(self.page.id)
+        self.assertIn("12\n", self.get(reverse("rango:show_category", args=["python"])))
+        self.assertEqual(self.get(reverse("rango:show_category", args=["django"])), django_page)
+
+        user = User.objects.create_user("rango", password="tango-with-django")
+        self.client.force_login(user)
+        self.client.get(reverse("rango:like_category"), {"category_id": self.python.id})
+        self.client.logout()
+        self.assertIn('<strong id="like_count">65</strong>',
+                      self.get(reverse("rango:show_category", args=["python"])))
+
+    def test_invalidated_by_category_changes(self):
+        self.get(reverse("rango:index"))
+        add_category("Django")
+        self.assertIn("/rango/category/django/", self.get(reverse("rango:index")))
+
+
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+class ConditionalGetTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.python = add_category("Python", likes=64)
+        self.page = add_page(self.python, "Official Python Tutorial", views=11)
+
+    def revalidate(self, url, data=None):
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return self.client.get(url, data, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def updated_at(self):
+        return Category.objects.get(id=self.python.id).updated_at
+
+    def test_category_page_not_modified(self):
+        url = reverse("rango:show_category", args=["python"])
+        self.assertEqual(self.revalidate(url).status_code, 304)
+
+        # Also when the page itself isn't cached any more, straight from the
+        # slug cache.
+        response = self.client.get(url)
+        cache.delete(page_cache.category_key("python"))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        last_modified = self.client.get(url)["Last-Modified"]
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_category_page_modified_by_page_changes(self):
+        url = reverse("rango:show_category", args=["python"])
+        etag = self.client.get(url)["ETag"]
+        add_page(self.python, "Learn Python in 10 Minutes")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)["ETag"]
+        ClickCounter(flush_size=1, background=False).record(self.page.id)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_logged_in_users_get_their_own_etag(self):
+        url = reverse("rango:show_category", args=["python"])
+        anonymous_etag = self.client.get(url)["ETag"]
+        self.client.force_login(User.objects.create_user("rango", password="tango-with-django"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=anonymous_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Last-Modified"))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_suggestions_not_modified(self):
+        url = reverse("rango:suggest")
+        self.assertEqual(self.revalidate(url, {"suggestion": "py"}).status_code, 304)
+
+        etag = self.client.get(url, {"suggestion": "py"})["ETag"]
+        add_category("Pyramid")
+        self.assertEqual(self.client.get(url, {"suggestion": "py"}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_page_listing_not_modified(self):
+        url = reverse("rango:page_listing", args=["python"])
+        self.assertEqual(self.revalidate(url, {"cursor": "11.1"}).status_code, 304)
+        self.assertEqual(self.client.get(reverse("rango:page_listing", args=["missing"])).status_code, 404)
+
+    def test_updated_at_propagates_to_category(self):
+        before = self.updated_at()
+        add_page(self.python, "Learn Python in 10 Minutes")
+        self.assertGreater(self.updated_at(), before)
+
+        before = self.updated_at()
+        ClickCounter(flush_size=1, background=False).record(self.page.id)
+        self.assertGreater(self.updated_at(), before)
+
+        before = self.updated_at()
+        increment_category_likes(self.python.id)
+        self.assertGreater(self.updated_at(), before)
+
+        before = self.updated_at()
+        self.page.delete()
+        self.assertGreater(self.updated_at(), before)
+
+
+class ThumbnailTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, RANGO_THUMBNAIL_BACKGROUND=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user("rango", password="tango-with-django")
+        self.client.force_login(self.user)
+
+    def upload(self, color="red", size=(800, 600)):
+        image = io.BytesIO()
+        Image.new("RGB", size, color).save(image, "JPEG")
+        return SimpleUploadedFile("car.jpg", image.getvalue(), content_type="image/jpeg")
+
+    def test_thumbnails_made_once_per_content(self):
+        profile = UserProfile.objects.create(user=self.user, picture=self.upload())
+        thumbnail_hash = make_thumbnails(profile.picture.name)
+        for size in (30, 300):
+            with default_storage.open(thumbnail_name(thumbnail_hash, size)) as f:
+                self.assertEqual(Image.open(f).size, (size, size))
+
+        other = UserProfile.objects.create(user=User.objects.create_user("tango"), picture=self.upload())
+        self.assertNotEqual(other.picture.name, profile.picture.name)
+        with mock.patch("rango.thumbnails.render_thumbnail") as render:
+            self.assertEqual(make_thumbnails(other.picture.name), thumbnail_hash)
+        render.assert_not_called()
+
+    def test_missing_thumbnails_made(self):
+        profiles = [UserProfile.objects.create(user=User.objects.create_user(name), picture=self.upload())
+                    for name in ("tango", "cash")]
+        out = io.StringIO()
+        call_command("backfill_thumbnails", stdout=out)
+        self.assertIn("Made thumbnails for 2 profiles", out.getvalue())
+        for profile in profiles:
+            profile.refresh_from_db()
+            self.assertTrue(profile.thumbnail_hash)
+
+    def test_all_remakes_existing_thumbnails(self):
+        profile = UserProfile.objects.create(user=self.user, picture=self.upload())
+        call_command("backfill_thumbnails", stdout=io.StringIO())
+        profile.refresh_from_db()
+        name = thumbnail_name(profile.thumbnail_hash, 30)
+        default_storage.delete(name)
+        default_storage.save(name, ContentFile(b"stale"))
+
+        call_command("backfill_thumbnails", stdout=io.StringIO())
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(), b"stale")
+        call_command("backfill_thumbnails", "--all", stdout=io.StringIO())
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(3), b"\xff\xd8\xff")
+
+    def test_missing_thumbnails_requested_when_shown(self):
+        profile = UserProfile.objects.create(user=self.user, picture=self.upload())
+        with override_settings(RANGO_THUMBNAIL_BACKGROUND=True), \
+                mock.patch("rango.thumbnails._get_executor") as executor:
+            for i in range(2):
+                self.client.get(reverse("rango:list_profiles"))
+        executor.return_value.submit.assert_called_once_with(mock.ANY, profile.id)
+
+    def test_templates_use_thumbnails_once_made(self):
+        profile = UserProfile.objects.create(user=self.user, picture=self.upload())
+        response = self.client.get(reverse("rango:list_profiles"))
+        self.assertContains(response, f'src="{profile.picture.url}"')
+
+        schedule_thumbnails(profile.id)
+        profile.refresh_from_db()
+        self.assertTrue(profile.thumbnail_hash)
+        response = self.client.get(reverse("rango:list_profiles"))
+        self.assertContains(response, f'src="/media/{thumbnail_name(profile.thumbnail_hash, 30)}"')
+        self.assertNotContains(response, profile.picture.url)
+        response = self.client.get(reverse("rango:profile", args=["rango"]))
+        self.assertContains(response, f'src="/media/{thumbnail_name(profile.thumbnail_hash, 300)}"')
+
+    def test_new_picture_resets_thumbnails(self):
+        profile = UserProfile.objects.create(user=self.user, picture=self.upload())
+        update_thumbnails(profile.id)
+        profile.refresh_from_db()
+        profile.website = "http://www.example.com/"
+        profile.save()
+        self.assertTrue(UserProfile.objects.get(id=profile.id).thumbnail_hash)
+
+        self.client.post(reverse("rango:profile", args=["rango"]), {"picture": self.upload("blue")})
+        profile.refresh_from_db()
+        self.assertEqual(profile.thumbnail_hash, "")
+
+
+class MediaServingTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.name = default_storage.save("profile_images/car.jpg", ContentFile(b"0123456789"))
+        self.url = "/media/" + self.name
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_whole_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), b"0123456789")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Cache-Control"], "public, max-age=3600")
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(response["Content-Length"], "4")
+
+        self.assertEqual(self.content(self.client.get(self.url, HTTP_RANGE="bytes=7-")), b"789")
+        self.assertEqual(self.content(self.client.get(self.url, HTTP_RANGE="bytes=-3")), b"789")
+        response = self.client.get(self.url, HTTP_RANGE="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+        # A range of an older version of the file gets the whole file.
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_hashed_names_cached_forever(self):
+        name = default_storage.save(thumbnail_name("0123456789abcdef" * 2 + "01234567", 30), ContentFile(b"x"))
+        response = self.client.get("/media/" + name)
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+
+    def test_sendfile_offload(self):
+        with self.settings(RANGO_MEDIA_SENDFILE="x-accel-redirect"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/" + self.name)
+        self.assertEqual(response.content, b"")
+        self.assertIn("ETag", response)
+
+        with self.settings(RANGO_MEDIA_SENDFILE="x-sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Sendfile"], default_storage.path(self.name))
+
+    def test_accel_redirect_is_a_uri(self):
+        name = default_storage.save("profile_images/café au lait.jpg", ContentFile(b"x"))
+        with self.settings(RANGO_MEDIA_SENDFILE="x-accel-redirect"):
+            response = self.client.get("/media/" + name)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/profile_images/caf%C3%A9%20au%20lait.jpg")
+
+    def test_stays_inside_media_root(self):
+        self.assertEqual(self.client.get("/media/../manage.py").status_code, 404)
+        self.assertEqual(self.client.get("/media/profile_images/").status_code, 404)
+        self.assertEqual(self.client.get("/media/missing.jpg").status_code, 404)
+
+
+class StaticPipelineTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        settings_override = override_settings(STATIC_ROOT=static_root.name,
+                                              STATICFILES_STORAGE="rango.staticfiles.RangoStaticFilesStorage")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command("collectstatic", interactive=False, verbosity=0, ignore_patterns=["admin"])
+
+    def test_bundles_hashed_and_compressed(self):
+        bundle = staticfiles_storage.stored_name("js/rango.js")
+        self.assertRegex(bundle, r"^js/rango\.[0-9a-f]{12}\.js$")
+        with staticfiles_storage.open(bundle) as f:
+            content = f.read()
+        for source in settings.RANGO_STATIC_BUNDLES["js/rango.js"]:
+            with staticfiles_storage.open(source) as f:
+                self.assertIn(f.read().strip(), content)
+        with staticfiles_storage.open(bundle + ".gz") as f:
+            self.assertEqual(gzip.decompress(f.read()), content)
+
+        response = self.client.get(reverse("rango:about"))
+        self.assertContains(response, f'<script src="/static/{bundle}"></script>', html=True)
+        self.assertContains(response, "/static/css/rango.", count=1)
+        self.assertNotContains(response, "jquery-3.3.1.min")
+
+    def test_serves_precompressed_variants(self):
+        bundle = staticfiles_storage.stored_name("css/rango.css")
+        factory = RequestFactory()
+        response = serve_static(factory.get("/static/" + bundle, HTTP_ACCEPT_ENCODING="gzip, deflate"), bundle)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        gzipped = b"".join(response.streaming_content)
+        response.close()
+
+        response = serve_static(factory.get("/static/" + bundle, HTTP_ACCEPT_ENCODING="gzip;q=0"), bundle)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(gzip.decompress(gzipped), b"".join(response.streaming_content))
+        response.close()
+
+    def test_source_files_linked_without_pipeline(self):
+        with self.settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"):
+            response = self.client.get(reverse("rango:about"))
+        for source in settings.RANGO_STATIC_BUNDLES["js/rango.js"]:
+            self.assertContains(response, f'<script src="/static/{source}"></script>', html=True)
+
+
+class SuggestionAPITests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        add_category("Python", likes=64)
+        add_category("Perl", likes=1)
+
+    def suggest(self, suggestion):
+        response = self.client.get(reverse("rango:suggest_json"), {"suggestion": suggestion})
+        self.assertEqual(response["Content-Type"], "application/json")
+        return json.loads(response.content)["categories"]
+
+    def test_compact_json(self):
+        self.assertEqual(self.suggest("p"), [["Python", "python"], ["Perl", "perl"]])
+        self.assertEqual(self.suggest("PE"), [["Perl", "perl"]])
+        # Nothing matches, or nothing typed: no suggestions.
+        self.assertEqual(self.suggest("zzz"), [])
+        self.assertEqual(self.suggest(""), [])
+
+    def test_cached_until_the_index_changes(self):
+        self.suggest("py")
+        with mock.patch.object(category_index, "search") as search, self.assertNumQueries(0):
+            self.assertEqual(self.suggest("PY"), [["Python", "python"]])
+        search.assert_not_called()
+
+        add_category("PyPy", likes=100)
+        self.assertEqual(self.suggest("py"), [["PyPy", "pypy"], ["Python", "python"]])
+
+    def test_concurrent_identical_lookups_coalesced(self):
+        category_index.build()
+        calls = []
+        release = threading.Event()
+        original_search = category_index.search
+
+        def slow_search(prefix, limit=None):
+            calls.append(prefix)
+            release.wait(5)
+            return original_search(prefix, limit)
+
+        results = []
+        with mock.patch.object(category_index, "search", slow_search):
+            threads = [threading.Thread(target=lambda: results.append(suggestion_responses.get("py")))
+                       for i in range(8)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(calls, ["py"])
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(results), 8)
+
+
+class SingleFlightTests(RangoTestCase):
+    def test_errors_shared_and_not_remembered(self):
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do("key", lambda: int("x"))
+        self.assertEqual(flight.do("key", lambda: 42), 42)
+
+
+class FakeClock:
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TrendingTests(RangoTestCase):
+    def test_window_forgets_old_clicks(self):
+        clock = FakeClock()
+        window = TrendingWindow(60, 3, half_life=1, clock=clock)
+        window.record(1, 4)
+        clock.now = 60
+        window.record(2, 3)
+        self.assertEqual(window.scores(), {1: 2.0, 2: 3.0})
+
+        # Three minutes on, the first minute has left the window.
+        clock.now = 180
+        self.assertEqual(window.scores(), {2: 0.75})
+        window.record(3)
+        self.assertEqual(window.scores(), {2: 0.75, 3: 1.0})
+        clock.now = 600
+        self.assertEqual(window.scores(), {})
+
+    def test_recent_clicks_rank_higher(self):
+        clock = FakeClock()
+        window = TrendingWindow(60, 60, half_life=15, clock=clock)
+        window.record(1, 10)
+        clock.now = 45 * 60
+        window.record(2, 5)
+        self.assertEqual([page_id for page_id, score in window.top(5)], [2, 1])
+
+    def test_top_recomputed_at_most_once_per_refresh(self):
+        clock = FakeClock()
+        window = TrendingWindow(60, 60, half_life=15, clock=clock)
+        window.record(1)
+        self.assertEqual(window.top(5), [(1, 1.0)])
+        window.record(2, 2)
+        with mock.patch.object(window, "_weights") as weights:
+            self.assertEqual(window.top(5), [(1, 1.0)])
+        weights.assert_not_called()
+        clock.now = 2
+        self.assertEqual(window.top(5), [(2, 2.0), (1, 1.0)])
+
+    def test_scores_kept_up_to_date(self):
+        clock = FakeClock()
+        window = TrendingWindow(60, 3, half_life=1, clock=clock)
+        for minute in range(10):
+            clock.now = minute * 60
+            window.record(minute % 2)
+            window.record(2)
+        # Only the last three minutes count, however the weights were rebased.
+        self.assertEqual(window.scores(), {0: 0.5, 1: 1.25, 2: 1.75})
+        self.assertEqual(window._clicks, {0: 1, 1: 2, 2: 3})
+
+    @override_settings(RANGO_TRENDING_REFRESH=0, RANGO_TRENDING_CANDIDATES=2)
+    def test_workers_publish_their_top_candidates(self):
+        clock = FakeClock()
+        first, second = Trending(clock, background=False), Trending(clock, background=False)
+        for page_id in range(1, 6):
+            second.record(page_id, page_id)
+        second.publish()
+        self.assertEqual(first.top_hour(), [(5, 5.0), (4, 4.0)])
+
+        # Published candidates age with the window.
+        clock.now = 15 * 60
+        self.assertEqual(first.top_hour(), [(5, 2.5), (4, 2.0)])
+
+    @override_settings(RANGO_TRENDING_PUBLISH_INTERVAL=0.01)
+    def test_clicks_published_in_the_background(self):
+        worker = Trending(background=True)
+        published = threading.Event()
+        publish = worker.publish
+        with mock.patch.object(worker, "publish", side_effect=lambda: (publish(), published.set())):
+            worker.record(1)
+            self.assertTrue(published.wait(2))
+        self.assertEqual(Trending(background=False)._others("hour")[0][1], [(1, 1.0)])
+
+    @override_settings(RANGO_TRENDING_REFRESH=0)
+    def test_workers_rank_each_others_clicks(self):
+        clock = FakeClock()
+        first, second = Trending(clock, background=False), Trending(clock, background=False)
+        first.record(1, 3)
+        second.record(2, 5)
+        second.record(1, 1)
+        first.publish()
+        second.publish()
+        for worker in (first, second):
+            self.assertEqual(worker.top_hour(), [(2, 5.0), (1, 4.0)])
+            self.assertEqual(worker.top_day(), [(2, 5.0), (1, 4.0)])
+
+        # A worker that restarts keeps counting towards the others' lists.
+        second.clear()
+        self.assertEqual(first.top_hour(), [(2, 5.0), (1, 4.0)])
+
+    def test_worker_snapshot_slots(self):
+        workers = [WorkerSnapshots("test") for i in range(3)]
+        for i, worker in enumerate(workers):
+            worker.publish(i, timeout=60)
+        workers[0].publish(10, timeout=60)
+        self.assertEqual(sorted(workers[0].collect()), [1, 2, 10])
+        self.assertEqual(sorted(workers[0].collect(include_self=False)), [1, 2])
+
+        # Once a worker's snapshot has expired, a new worker takes its slot.
+        cache.delete("rango:test:slot:2")
+        WorkerSnapshots("test").publish(3, timeout=60)
+        self.assertEqual(sorted(workers[0].collect()), [2, 3, 10])
+        self.assertEqual(cache.get("rango:test:slots"), 3)
+
+    @override_settings(RANGO_TRENDING_REFRESH=0, RANGO_CLICK_FLUSH_BACKGROUND=False)
+    def test_home_page_shows_trending_pages(self):
+        python = add_category("Python")
+        old = add_page(python, "Old Favourite", views=1000)
+        new = add_page(python, "Hot New Thing")
+        self.assertContains(self.client.get(reverse("rango:index")), "Nothing has been clicked this hour.")
+
+        for i in range(3):
+            self.client.get(reverse("rango:goto"), {"page_id": new.id})
+        self.client.get(reverse("rango:goto"), {"page_id": old.id})
+        cache.clear()
+
+        response = self.client.get(reverse("rango:index"))
+        self.assertEqual(response.context["trending_hour"], [new, old])
+        self.assertEqual(response.context["trending_day"], [new, old])
+        self.assertContains(response, f'{reverse("rango:goto")}?page_id={new.id}')
+
+
+@override_settings(RANGO_CLICK_EVENT_LOG=True, RANGO_EVENT_AGGREGATION_LAG=0)
+class ClickEventLogTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.python = add_category("Python", likes=10)
+        self.pages = [add_page(self.python, f"Page {i}", views=100) for i in range(3)]
+
+    def views(self):
+        return list(Page.objects.order_by("id").values_list("views", flat=True))
+
+    def click(self, *pages):
+        for page in pages:
+            self.client.get(reverse("rango:goto"), {"page_id": page.id})
+
+    def test_requests_only_append(self):
+        with self.assertNumQueries(2):
+            # The page's URL, then the event.
+            self.click(self.pages[0])
+        self.assertEqual(ClickEvent.objects.get().kind, ClickEvent.VIEW)
+        self.assertEqual(self.views(), [100, 100, 100])
+        self.assertEqual(click_counter.pending(), {})
+
+        self.client.force_login(User.objects.create_user("rango", password="tango-with-django"))
+        for i in range(2):
+            response = self.client.get(reverse("rango:like_category"), {"category_id": self.python.id})
+            self.assertEqual(response.content, b"11")
+        self.assertEqual(ClickEvent.objects.filter(kind=ClickEvent.LIKE).count(), 1)
+
+    def test_aggregate_applies_each_event_once(self):
+        self.click(self.pages[0], self.pages[0], self.pages[2])
+        self.assertEqual(events.aggregate(), 3)
+        self.assertEqual(self.views(), [102, 100, 101])
+        self.assertEqual(events.aggregate(), 0)
+        self.assertEqual(self.views(), [102, 100, 101])
+
+        self.click(self.pages[1])
+        out = io.StringIO()
+        call_command("aggregate_events", "--drain", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Applied 1 event.")
+        self.assertEqual(self.views(), [102, 101, 101])
+        self.assertEqual(EventCheckpoint.objects.get().last_event_id, ClickEvent.objects.latest("id").id)
+
+    def test_crash_mid_batch_loses_and_repeats_nothing(self):
+        self.click(*self.pages, *self.pages)
+        events.record_like(self.python.id)
+
+        # Dies after the page views of the second batch were written.
+        with mock.patch("rango.events.add_category_likes", side_effect=RuntimeError("killed")):
+            with self.assertRaises(RuntimeError):
+                events.drain(batch_size=4)
+        # The first batch of four stays applied; the second is rolled back.
+        self.assertEqual(self.views(), [102, 101, 101])
+        self.assertEqual(Category.objects.get(id=self.python.id).likes, 10)
+        self.assertEqual(EventCheckpoint.objects.get().last_event_id, ClickEvent.objects.order_by("id")[3].id)
+
+        self.assertEqual(events.drain(batch_size=4), 3)
+        self.assertEqual(self.views(), [102, 102, 102])
+        self.assertEqual(Category.objects.get(id=self.python.id).likes, 11)
+        self.assertEqual(events.drain(), 0)
+
+    def test_young_events_left_for_the_next_run(self):
+        self.click(self.pages[0])
+        self.assertEqual(events.aggregate(lag=60), 0)
+        self.assertEqual(events.aggregate(lag=0), 1)
+
+
+@override_settings(RANGO_READ_REPLICAS=["replica"])
+class ReplicaRouterTests(RangoTestMixin, TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("rango", password="tango-with-django")
+        add_category("Python")
+        copy_sqlite_database()
+        db_router.reset()
+
+    def tearDown(self):
+        db_router.reset()
+
+    def test_reads_from_replica_until_synced(self):
+        add_category("Django")
+        db_router.reset()
+        self.assertEqual(Category.objects.count(), 1)
+        copy_sqlite_database()
+        self.assertEqual(Category.objects.count(), 2)
+
+    def test_reads_after_a_write_go_to_primary(self):
+        add_category("Django")
+        self.assertEqual(Category.objects.count(), 2)
+
+    def test_browser_reads_its_own_writes(self):
+        self.client.force_login(self.user)
+        copy_sqlite_database()
+        response = self.client.post(reverse("rango:add_category"), {"name": "Django", "views": 0, "likes": 0})
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+        self.assertContains(self.client.get(reverse("rango:show_category", args=["django"])), "Django")
+
+        # Without the cookie the replica, which hasn't caught up, is read.
+        self.client.post(reverse("rango:add_page", args=["django"]),
+                         {"title": "Django Tutorial", "url": "http://www.djangoproject.com/", "views": 0})
+        index = reverse("rango:index")
+        self.assertContains(self.client.get(index), "Django Tutorial")
+        del self.client.cookies[db_router.PIN_COOKIE]
+        self.assertNotContains(self.client.get(index), "Django Tutorial")
+        copy_sqlite_database()
+        self.assertContains(self.client.get(index), "Django Tutorial")
+
+    def test_conditional_responses_read_from_primary(self):
+        # The validators come from the primary, so the body must too: a stale
+        # body under a fresh ETag would be revalidated with a 304 for good.
+        self.client.force_login(self.user)
+        python = Category.objects.get(slug="python")
+        add_page(python, "Official Python Tutorial")
+        db_router.reset()
+        for url in (reverse("rango:page_listing", args=["python"]),
+                    reverse("rango:show_category", args=["python"])):
+            response = self.client.get(url)
+            self.assertContains(response, "Official Python Tutorial")
+            copy_sqlite_database()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_version_keyed_caches_filled_from_primary(self):
+        # The new category bumped the versions, but the replica hasn't got it.
+        add_category("Django")
+        db_router.reset()
+        self.assertEqual(len(get_sidebar_categories()), 2)
+        self.assertEqual(category_slugs.get("django").name, "Django")
+        response = self.client.get(reverse("rango:show_category", args=["django"]))
+        self.assertNotContains(response, "does not exist")
+
+    def test_reads_only_requests_not_pinned(self):
+        response = self.client.get(reverse("rango:show_category", args=["python"]))
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+
+class CategorySlugCacheTests(RangoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.python = add_category("Python", views=3, likes=64)
+
+    def test_lookups_cached(self):
+        category = category_slugs.get("python")
+        self.assertEqual((category.id, category.name, category.slug, category.views, category.likes),
+                         (self.python.id, "Python", "python", 3, 64))
+        with self.assertNumQueries(0):
+            self.assertEqual(category_slugs.get("python"), self.python)
+
+    def test_versions_read_in_one_round_trip(self):
+        category_slugs.get("python")
+        # As a memcached client would, get_many fetches every key at once.
+        versions = {key: cache.get(key) for key in ("rango:version:categories", "rango:version:category:python")}
+        with mock.patch.object(cache, "get") as get, \
+                mock.patch.object(cache, "get_many", return_value=versions) as get_many:
+            self.assertEqual(category_slugs.get("python"), self.python)
+        get.assert_not_called()
+        get_many.assert_called_once_with(list(versions))
+
+    def test_unknown_slugs_cached(self):
+        self.assertIsNone(category_slugs.get("no-such-category"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(category_slugs.get("no-such-category"))
+        add_category("No Such Category")
+        self.assertIsNotNone(category_slugs.get("no-such-category"))
+
+    def test_changes_seen(self):
+        category_slugs.get("python")
+        increment_category_likes(self.python.id)
+        page_cache.categories_changed([self.python.id])
+        self.assertEqual(category_slugs.get("python").likes, 65)
+
+        self.python.name = "Snake"
+        self.python.save()
+        self.assertIsNone(category_slugs.get("python"))
+        self.assertEqual(category_slugs.get("snake").name, "Snake")
+
+    def test_validators_read_through_the_cache(self):
+        self.client.force_login(User.objects.create_user("rango", password="tango-with-django"))
+        for slug in ("python", "no-such-category"):
+            self.client.get(reverse("rango:show_category", args=[slug]))
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse("rango:show_category", args=[slug]))
+            self.assertFalse([q for q in queries if 'FROM "rango_category"' in q["sql"]], slug)
+
+    def test_views_look_up_through_the_cache(self):
+        self.client.force_login(User.objects.create_user("rango", password="tango-with-django"))
+        self.client.get(reverse("rango:show_category", args=["python"]))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("rango:add_page", args=["python"]))
+        self.assertContains(response, "Add a Page to Python")
+        self.assertFalse([q for q in queries if 'FROM "rango_category"' in q["sql"]])
+
+        self.client.post(reverse("rango:add_page", args=["python"]),
+                         {"title": "Official Python Tutorial", "url": "http://docs.python.org/3/tutorial/",
+                          "views": 0})
+        self.assertEqual(Page.objects.get().category, self.python)
+
+
+class SQLiteTuningTests(RangoTestCase):
+    def pragmas(self, **overrides):
+        # A fresh connection to a file database, as a new worker would open.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, "tuning.sqlite3"), **overrides)
+        wrapper = DatabaseWrapper(settings_dict, alias="tuning")
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            return {name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                    for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size")}
+
+    @override_settings(RANGO_SQLITE_TUNING=True)
+    def test_pragmas_applied_to_new_connections(self):
+        self.assertEqual(self.pragmas(), {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000,
+                                          "cache_size": -64000, "mmap_size": 256 * 1024 * 1024})
+
+    @override_settings(RANGO_SQLITE_TUNING=True, RANGO_SQLITE_PRAGMAS={"journal_mode": "wal", "busy_timeout": 100})
+    def test_custom_pragmas(self):
+        pragmas = self.pragmas()
+        self.assertEqual((pragmas["journal_mode"], pragmas["busy_timeout"]), ("wal", 100))
+
+    def test_off_by_default(self):
+        self.assertEqual(self.pragmas()["journal_mode"], "delete")
@@ -0,0 +1,159 @@
+import hashlib
+import io
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from rango.models import UserProfile
+
+
+# Profile pictures are shown as small squares, so each upload is scaled once
+# to every size in RANGO_THUMBNAIL_SIZES, as JPEG and (where Pillow supports
+# it) WebP. The files are named after the picture's content,
+#
+#   profile_images/thumbnails/<hash>.<size>.jpg
+#
+# so they never change once written and identical uploads share them.
+
+THUMBNAIL_DIR = "profile_images/thumbnails"
+
+_executor = None
+_executor_lock = threading.Lock()
+# (profile id, picture) pairs whose missing thumbnails were already asked for.
+_requested = set()
+
+
+def thumbnail_sizes():
+    return getattr(settings, "RANGO_THUMBNAIL_SIZES", (30, 300))
+
+
+def thumbnail_formats():
+    if features.check("webp"):
+        return ("jpg", "webp")
+    return ("jpg",)
+
+
+def thumbnail_name(thumbnail_hash, size, extension="jpg"):
+    return posixpath.join(THUMBNAIL_DIR, f"{thumbnail_hash}.{size}.{extension}")
+
+
+def file_hash(f):
+    digest = hashlib.sha1()
+    for chunk in f.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_thumbnail(image, size, extension):
+    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    out = io.BytesIO()
+    if extension == "webp":
+        thumbnail.save(out, "WEBP", quality=80, method=4)
+    else:
+        thumbnail.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def make_thumbnails(name, storage=default_storage, overwrite=False):
+    """
+    Writes the thumbnails of the picture stored under name, skipping those
+    that already exist unless overwrite is given, and returns the picture's
+    content hash.
+    """
+    with storage.open(name) as f:
+        thumbnail_hash = file_hash(f)
+        missing = [(size, extension) for size in thumbnail_sizes() for extension in thumbnail_formats()
+                   if overwrite or not storage.exists(thumbnail_name(thumbnail_hash, size, extension))]
+        if not missing:
+            return thumbnail_hash
+
+        f.seek(0)
+        image = Image.open(f)
+        # Lets the JPEG decoder scale down while decoding, which is much
+        # faster than decoding a full size photo and scaling it afterwards.
+        image.draft("RGB", (max(thumbnail_sizes()),) * 2)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for size, extension in missing:
+            thumbnail = thumbnail_name(thumbnail_hash, size, extension)
+            content = ContentFile(render_thumbnail(image, size, extension))
+            # Storages save under a new name rather than overwrite.
+            storage.delete(thumbnail)
+            storage.save(thumbnail, content)
+    return thumbnail_hash
+
+
+def update_thumbnails(profile_id, overwrite=False):
+    profile = UserProfile.objects.filter(id=profile_id).only("picture", "thumbnail_hash").first()
+    if profile is None or not profile.picture:
+        return
+    thumbnail_hash = make_thumbnails(profile.picture.name, overwrite=overwrite)
+    if thumbnail_hash != profile.thumbnail_hash:
+        # Unless the picture was replaced in the meantime.
+        UserProfile.objects.filter(id=profile_id, picture=profile.picture.name).update(
+            thumbnail_hash=thumbnail_hash)
+
+
+def _update_in_worker(profile_id):
+    try:
+        update_thumbnails(profile_id)
+    except Exception as e:
+        print(f"Thumbnails for profile {profile_id} failed: {e}")
+    finally:
+        # Every worker thread gets its own connection; don't leak it.
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, "RANGO_THUMBNAIL_WORKERS", 2),
+                                           thread_name_prefix="rango-thumbnails")
+        return _executor
+
+
+def schedule_thumbnails(profile_id):
+    """Makes a profile's thumbnails in the worker pool, off the request path."""
+    if getattr(settings, "RANGO_THUMBNAIL_BACKGROUND", True):
+        _get_executor().submit(_update_in_worker, profile_id)
+    else:
+        update_thumbnails(profile_id)
+
+
+def thumbnail_url(profile, size, extension="jpg"):
+    """
+    The URL of a profile's thumbnail, or of the picture itself until its
+    thumbnails have been made. Returns "" for a WebP thumbnail that doesn't
+    exist.
+    """
+    if not profile.picture:
+        return ""
+    if not profile.thumbnail_hash:
+        request_missing_thumbnails(profile)
+    elif size in thumbnail_sizes() and extension in thumbnail_formats():
+        return default_storage.url(thumbnail_name(profile.thumbnail_hash, size, extension))
+    return profile.picture.url if extension == "jpg" else ""
+
+
+def request_missing_thumbnails(profile):
+    """
+    Schedules the thumbnails of a profile shown without them, such as one
+    saved before thumbnails existed, once per process. Only done with
+    background thumbnailing, so a page render never waits for it;
+    "manage.py backfill_thumbnails" makes them all at once.
+    """
+    if not getattr(settings, "RANGO_THUMBNAIL_BACKGROUND", True):
+        return
+    key = (profile.id, profile.picture.name)
+    with _executor_lock:
+        if key in _requested:
+            return
+        _requested.add(key)
+    schedule_thumbnails(profile.id)
@@ -0,0 +1,263 @@
+import heapq
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from rango.caching import WorkerSnapshots
+
+
+class TrendingWindow:
+    """
+    Clicks per page over the last `buckets` periods of `bucket_seconds`,
+    held in a ring buffer: each slot counts the clicks of one period and is
+    reused once that period has left the window.
+
+    A page's score is its clicks weighted by age, halving every half_life
+    periods, so a burst of clicks now outranks the same burst an hour ago.
+    Scores are kept up to date as clicks come in: each click is added with
+    a weight that grows with its period, so the ranking of older clicks
+    never has to be recomputed, and the clicks of a period are subtracted
+    again when it leaves the window. A click costs the same however many
+    pages have been clicked.
+    """
+
+    def __init__(self, bucket_seconds, buckets, half_life, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.half_life = half_life
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counts = [{} for i in range(buckets)]
+        # The period each slot currently counts.
+        self._periods = [None] * buckets
+        # Per page, its clicks in the window and the sum of their weights,
+        # 2 ** ((period - base) / half_life). Scaled by the current period's
+        # weight, the sums are the scores.
+        self._clicks = {}
+        self._weighted = {}
+        self._base = None
+        self._version = 0
+        self._top = None
+
+    def period(self):
+        return int(self._clock() // self.bucket_seconds)
+
+    def _weight(self, period):
+        return 2 ** ((period - self._base) / self.half_life)
+
+    def _advance(self, period):
+        # Called with the lock held. Drops the periods that have left the
+        # window, and moves the base along so the weights stay small.
+        for slot, slot_period in enumerate(self._periods):
+            if slot_period is None or period - slot_period < self.buckets:
+                continue
+            weight = self._weight(slot_period)
+            for page_id, count in self._counts[slot].items():
+                clicks = self._clicks[page_id] - count
+                if clicks:
+                    self._clicks[page_id] = clicks
+                    self._weighted[page_id] -= count * weight
+                else:
+                    del self._clicks[page_id]
+                    del self._weighted[page_id]
+            self._counts[slot] = {}
+            self._periods[slot] = None
+            self._version += 1
+        if self._base is None or not self._weighted:
+            self._base = period
+        elif period - self._base >= self.buckets:
+            # Once per window length, every weight is rescaled.
+            scale = 0.5 ** ((period - self._base) / self.half_life)
+            self._weighted = {page_id: weighted * scale for page_id, weighted in self._weighted.items()}
+            self._base = period
+
+    def record(self, page_id, count=1):
+        period = self.period()
+        slot = period % self.buckets
+        with self._lock:
+            self._advance(period)
+            if self._periods[slot] != period:
+                self._counts[slot] = {}
+                self._periods[slot] = period
+            counts = self._counts[slot]
+            counts[page_id] = counts.get(page_id, 0) + count
+            self._clicks[page_id] = self._clicks.get(page_id, 0) + count
+            self._weighted[page_id] = self._weighted.get(page_id, 0) + count * self._weight(period)
+            self._version += 1
+
+    def state(self):
+        """Changes whenever the scores do, other than by ageing."""
+        period = self.period()
+        with self._lock:
+            self._advance(period)
+            return self._version
+
+    def _weights(self):
+        # A copy, so ranking doesn't hold up clicks. Every score is its
+        # weighted sum times the same scale, so the sums rank the same.
+        period = self.period()
+        with self._lock:
+            self._advance(period)
+            return period, dict(self._weighted), 0.5 ** ((period - self._base) / self.half_life)
+
+    def candidates(self, limit):
+        """
+        This process's limit highest scoring pages, as (period, [(page_id,
+        score), ...]), for the other processes to rank alongside their own.
+        """
+        period, weighted, scale = self._weights()
+        best = heapq.nlargest(limit, weighted, key=weighted.__getitem__)
+        return period, [(page_id, weighted[page_id] * scale) for page_id in best]
+
+    def _add_others(self, scores, others, period, local):
+        for other_period, candidates in others:
+            age = period - other_period
+            if not 0 <= age < self.buckets:
+                continue
+            decay = 0.5 ** (age / self.half_life)
+            for page_id, score in candidates:
+                if page_id not in scores:
+                    scores[page_id] = local(page_id)
+                scores[page_id] += score * decay
+        return scores
+
+    def scores(self, others=()):
+        """
+        Scores of all the pages clicked in the window, counting this
+        process's clicks and the candidates() of other processes passed in
+        others.
+        """
+        period, weighted, scale = self._weights()
+        scores = {page_id: value * scale for page_id, value in weighted.items()}
+        return self._add_others(scores, others, period, lambda page_id: 0)
+
+    def top(self, limit=5, others=None):
+        """
+        The limit highest scoring pages as (page_id, score), best first.
+        Recomputed at most every RANGO_TRENDING_REFRESH seconds, and, when
+        only this process's clicks count, only if there were clicks or the
+        window moved on since. others is a callable returning the other
+        processes' candidates.
+        """
+        now = self._clock()
+        state = (self.period(), self._version, limit)
+        cached = self._top
+        if cached is not None and cached[1][2] == limit and (
+                (others is None and cached[1] == state) or
+                now - cached[0] < getattr(settings, "RANGO_TRENDING_REFRESH", 1)):
+            return cached[2]
+
+        # Only this process's own top pages and the others' candidates can
+        # make the list; nothing else needs a score.
+        period, weighted, scale = self._weights()
+        scores = {page_id: weighted[page_id] * scale
+                  for page_id in heapq.nlargest(limit, weighted, key=weighted.__getitem__)}
+        self._add_others(scores, others() if others is not None else (), period,
+                         lambda page_id: weighted.get(page_id, 0) * scale)
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        self._top = (now, state, top)
+        return top
+
+    def clear(self):
+        with self._lock:
+            self._counts = [{} for i in range(self.buckets)]
+            self._periods = [None] * self.buckets
+            self._clicks = {}
+            self._weighted = {}
+            self._base = None
+            self._version += 1
+            self._top = None
+
+
+class Trending:
+    """
+    Clicks per page over the last hour and the last day.
+
+    Each process counts its own clicks, and publishes its top
+    RANGO_TRENDING_CANDIDATES pages of each window to the cache every
+    RANGO_TRENDING_PUBLISH_INTERVAL seconds, from a timer thread unless
+    background publishing is off; the lists rank those alongside the
+    process's own clicks. With a cache shared by the workers, every worker
+    shows the same lists, and a worker's clicks still count for the rest of
+    the day after it restarts. With a per-process cache, each worker only
+    ranks its own clicks.
+    """
+
+    def __init__(self, clock=time.time, background=None):
+        self.hour = TrendingWindow(60, 60, half_life=15, clock=clock)
+        self.day = TrendingWindow(60 * 60, 24, half_life=6, clock=clock)
+        self._background = background
+        self._workers = WorkerSnapshots("trending")
+        self._lock = threading.Lock()
+        self._published_at = None
+        self._published_state = None
+        self._timer_pid = None
+
+    @property
+    def publish_interval(self):
+        return getattr(settings, "RANGO_TRENDING_PUBLISH_INTERVAL", 5)
+
+    @property
+    def background(self):
+        if self._background is not None:
+            return self._background
+        return getattr(settings, "RANGO_TRENDING_PUBLISH_BACKGROUND", True)
+
+    def record(self, page_id, count=1):
+        self.hour.record(page_id, count)
+        self.day.record(page_id, count)
+        if self.background:
+            self._start_timer()
+        elif self._published_at is None or time.monotonic() - self._published_at >= self.publish_interval:
+            self.publish()
+
+    def _state(self):
+        return (self.hour.period(), self.hour.state(), self.day.period(), self.day.state())
+
+    def publish(self):
+        self._published_at = time.monotonic()
+        self._published_state = self._state()
+        limit = getattr(settings, "RANGO_TRENDING_CANDIDATES", 200)
+        # Kept for as long as the clicks count towards the day's list.
+        self._workers.publish({"hour": self.hour.candidates(limit), "day": self.day.candidates(limit)},
+                              timeout=self.day.bucket_seconds * self.day.buckets)
+
+    def _start_timer(self):
+        # Threads don't survive a fork, so each worker process starts its own.
+        if self._timer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+        threading.Thread(target=self._run_timer, daemon=True, name="trending").start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.publish_interval)
+            # Only when there were clicks or a window moved on since.
+            if self._state() != self._published_state:
+                try:
+                    self.publish()
+                except Exception as e:
+                    print(f"Trending publish failed: {e}")
+
+    def _others(self, window):
+        return [snapshot[window] for snapshot in self._workers.collect(include_self=False)]
+
+    def top_hour(self, limit=5):
+        return self.hour.top(limit, others=lambda: self._others("hour"))
+
+    def top_day(self, limit=5):
+        return self.day.top(limit, others=lambda: self._others("day"))
+
+    def clear(self):
+        self.hour.clear()
+        self.day.clear()
+        self._published_at = None
+        self._published_state = None
+
+
+trending = Trending()
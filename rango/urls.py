@@ -10,16 +10,20 @@ urlpatterns = [
              views.AddPageView.as_view(), name="add_page"),
         path("category/<slug:category_name_slug>/", 
              views.ShowCategoryView.as_view(), name = "show_category"),
+        path("category/<slug:category_name_slug>/pages/", 
+             views.PageListingView.as_view(), name = "page_listing"),
         path("add_category/", views.AddCategoryView.as_view(), name="add_category"),
         path("register_profile/", views.RegisterProfileView.as_view(), name="register_profile"),
         #path("login/", views.user_login, name="login"),
         #path("logout/", views.user_logout, name="logout"),
         path("restricted/", views.restricted, name="restricted"),
-        #path("search/", views.search, name="search"),
+        path("search/", views.SearchView.as_view(), name="search"),
         path("goto/", views.goto_url, name="goto"),
         path("profiles/", views.ListProfilesView.as_view(), name="list_profiles"),
         path("profile/<username>/", views.ProfileView.as_view(), name="profile"),
         path("like_category/", views.LikeCategoryView.as_view(), name="like_category"),
         path("suggest/", views.CategorySuggestionView.as_view(), name="suggest"),
+        path("suggest/json/", views.CategorySuggestionAPIView.as_view(), name="suggest_json"),
         path("search_add_page/", views.SearchAddPageView.as_view(), name="search_add_page"),
+        path("metrics/", views.metrics_view, name="metrics"),
     ]
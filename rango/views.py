@@ -1,15 +1,29 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
-from rango.models import Category, Page, UserProfile
+from django.http import Http404, HttpResponse
+from django.core.exceptions import PermissionDenied
+from rango.models import Category, CategoryLike, Page, UserProfile
 from rango.forms import CategoryForm, PageForm, UserProfileForm, UserForm
 from django.urls import reverse
+from django.conf import settings
 #from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from datetime import datetime
-from rango.bing_search import run_query
+import hmac
+import time
+from rango import events, metrics, page_cache
+from rango.bing_search import search_results
+from rango.category_cache import category_slugs
+from rango.conditional import category_etag, category_last_modified, make_etag, page_listing_etag
+from rango.counters import click_counter, increment_category_likes
+from rango.page_cache import AnonymousPageCacheMixin
+from rango.pagination import category_pages, user_profile_count, user_profiles
+from rango.suggestions import category_index, suggestion_responses
+from rango.trending import trending
 from django.views import View
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 
 
 class AboutView(View):
@@ -42,7 +56,14 @@ class AddCategoryView(View):
         return render(request, "rango/add_category.html", {"form":form})
         
 # responsible for main page view
-class IndexView(View):
+class IndexView(AnonymousPageCacheMixin, View):
+    def page_cache_key(self, request):
+        return page_cache.index_key()
+    
+    def page_cache_hit(self, request, response):
+        # Visits are still counted for cached pages.
+        visitor_cookie_handler(request)
+    
     def get(self, request):
         # Query the database for a list of ALL categories currently stored.
         # Order the categories by the number of likes in descending order.
@@ -50,10 +71,18 @@ class IndexView(View):
         category_list = Category.objects.order_by("-likes")[:5]
         pages = Page.objects.order_by("-views")[:5]
         
+        # The pages clicked most recently, from this worker's click windows;
+        # both lists are fetched with a single query.
+        trending_hour = [page_id for page_id, score in trending.top_hour(5)]
+        trending_day = [page_id for page_id, score in trending.top_day(5)]
+        trending_pages = Page.objects.in_bulk(set(trending_hour + trending_day)) if trending_day else {}
+        
         context_dict = {}
         context_dict["boldmessage"] = "Crunchy, creamy, cookie, candy, cupcake!"
         context_dict["pages"] = pages
         context_dict["categories"] = category_list
+        context_dict["trending_hour"] = [trending_pages[i] for i in trending_hour if i in trending_pages]
+        context_dict["trending_day"] = [trending_pages[i] for i in trending_day if i in trending_pages]
         
         # Increment counter
         visitor_cookie_handler(request)
@@ -62,21 +91,27 @@ class IndexView(View):
         return response
     
 
-class ShowCategoryView(View):
+class ShowCategoryView(AnonymousPageCacheMixin, View):
+    def page_cache_key(self, request, category_name_slug):
+        return page_cache.category_key(category_name_slug)
+    
     def populate_dictionary(self, category_name_slug):
         context_dict = {}
         try:
             # Can we find a category name slug with the given name?
-            # If yes, then the .get() method returns one model instance.
-            # If we cannot, the .get() method raises a DoesNotExist exception.
-            category = Category.objects.get(slug = category_name_slug)
+            # The slug cache returns the model instance, or None if there is
+            # no such category (unknown slugs are cached too).
+            category = category_slugs.get(category_name_slug)
+            if category is None:
+                raise Category.DoesNotExist
             
-            # Retrive all of the associated pages.
-            # The filter() will return a list of page objects or an empty list.
-            pages = Page.objects.filter(category = category).order_by("-views")[:5]
+            # Retrive the first batch of the associated pages, and the cursor
+            # the "Load more" button uses to fetch the next batch.
+            pages, next_cursor = category_pages(category.id)
             
             # Adds our results list to the template context under name pages.
             context_dict["pages"] = pages
+            context_dict["next_cursor"] = next_cursor
             # We also add the category object from the database to the 
             # context dictionary. We will use this in the templage to verify
             # to verify that the category exists.
@@ -90,6 +125,7 @@ class ShowCategoryView(View):
         
         return context_dict
     
+    @method_decorator(condition(etag_func=category_etag, last_modified_func=category_last_modified))
     def get(self, request, category_name_slug):
         context_dict = self.populate_dictionary(category_name_slug)
         return render(request, "rango/category.html", context=context_dict)
@@ -102,12 +138,39 @@ class ShowCategoryView(View):
             query = request.POST["query"].strip()
             if query:
                 # Run the Bing search function to get the result list
-                result_list = run_query(query)
+                result_list = search_results(request, query)
         context_dict["result_list"] = result_list
         context_dict["query"] = query
         return render(request, "rango/category.html", context=context_dict)
 
 
+class SearchView(View):
+    def get(self, request):
+        return render(request, "rango/search.html", {"result_list":[], "query":""})
+    
+    def post(self, request):
+        result_list = []
+        query = request.POST.get("query", "").strip()
+        if query:
+            # Run the configured search backend to get the result list
+            result_list = search_results(request, query)
+            
+        return render(request, "rango/search.html", {"result_list":result_list, "query":query})
+
+
+class PageListingView(View):
+    @method_decorator(condition(etag_func=page_listing_etag))
+    def get(self, request, category_name_slug):
+        category = category_slugs.get(category_name_slug)
+        if category is None:
+            raise Http404("Category not found.")
+        
+        pages, next_cursor = category_pages(category.id, request.GET.get("cursor"))
+        context_dict = {"pages": pages, "next_cursor": next_cursor,
+                        "category": {"slug": category_name_slug}}
+        return render(request, "rango/page_listing_items.html", context_dict)
+
+
 class AddPageView(View):
     @method_decorator(login_required)
     def get(self, request, category_name_slug):
@@ -144,12 +207,9 @@ class AddPageView(View):
         return render(request, "rango/add_page.html", context=context_dict)
         
     
+    @staticmethod
     def getCategory(category_name_slug):
-        try:
-            category = Category.objects.get(slug=category_name_slug)
-        except:
-            category = None
-        return category
+        return category_slugs.get(category_name_slug)
 
 
 class RegisterProfileView(View):
@@ -229,8 +289,10 @@ class ProfileView(View):
 class ListProfilesView(View):
     @method_decorator(login_required)
     def get(self, request):
-        profiles = UserProfile.objects.all()
-        return render(request, "rango/list_profiles.html", {"user_profile_list":profiles})
+        profiles, next_after = user_profiles(request.GET.get("after"))
+        return render(request, "rango/list_profiles.html", {"user_profile_list":profiles,
+                                                            "next_after":next_after,
+                                                            "user_profile_count":user_profile_count()})
 
 
 class LikeCategoryView(View):
@@ -239,31 +301,76 @@ class LikeCategoryView(View):
         category_id = request.GET.get("category_id")
         
         try:
-            category = Category.objects.get(id=int(category_id))
-        except Category.DoesNotExist:
-            return HttpResponse(-1)
-        except ValueError:
+            category_id = int(category_id)
+        except (TypeError, ValueError):
             return HttpResponse(-1)
         
-        category.likes += 1
-        category.save()
+        if events.event_log_enabled():
+            return HttpResponse(self.log_like(request, category_id))
         
-        return HttpResponse(category.likes)
+        try:
+            with transaction.atomic():
+                likes = increment_category_likes(category_id)
+                if likes is None:
+                    return HttpResponse(-1)
+                # The unique constraint on the like ledger rolls the increment
+                # back if this user has already liked the category.
+                CategoryLike.objects.create(user=request.user, category_id=category_id)
+        except IntegrityError:
+            likes = Category.objects.filter(id=category_id).values_list("likes", flat=True).first()
+        else:
+            category_index.update_likes(category_id, likes)
+            page_cache.categories_changed([category_id])
+        
+        return HttpResponse(likes)
+    
+    def log_like(self, request, category_id):
+        try:
+            with transaction.atomic():
+                CategoryLike.objects.create(user=request.user, category_id=category_id)
+                events.record_like(category_id)
+        except IntegrityError:
+            pass
+        likes = Category.objects.filter(id=category_id).values_list("likes", flat=True).first()
+        if likes is None:
+            return -1
+        # Likes still waiting for the event aggregator count too.
+        return likes + events.pending_likes(category_id)
 
 
-class CategorySuggestionView(View):
-    def get(self, request):
-        if "suggestion" in request.GET:
-            suggestion = request.GET.get("suggestion")
-        else:
-            suggestion = ""
-            
-        category_list=  get_category_list(max_results=8, starts_with=suggestion)
+def suggested_categories(request):
+    # Needed by both the ETag and the view; look them up once per request.
+    if not hasattr(request, "_rango_suggestions"):
+        suggestion = request.GET.get("suggestion", "")
+        category_list = get_category_list(max_results=8, starts_with=suggestion)
         
+        # Nothing matches: the most liked categories, not the whole table.
         if len(category_list)==0:
-            category_list = Category.objects.order_by("-likes")
-        
-        return render(request, "rango/categories.html", {"categories":category_list})
+            category_list = category_index.top(8)
+        request._rango_suggestions = category_list
+    return request._rango_suggestions
+
+
+def suggestion_etag(request):
+    # The suggestions come from the in-memory index, so hashing what would
+    # be rendered costs no queries and is the same in every process.
+    return make_etag("suggestion", *((c.id, c.name, c.slug) for c in suggested_categories(request)))
+
+
+class CategorySuggestionView(View):
+    @method_decorator(condition(etag_func=suggestion_etag))
+    def get(self, request):
+        return render(request, "rango/categories.html", {"categories":suggested_categories(request)})
+
+
+class CategorySuggestionAPIView(View):
+    def get(self, request):
+        # The matching categories as [[name, slug], ...] JSON, encoded once
+        # per prefix and index version rather than rendered per keystroke.
+        # Unlike the HTML view there's no fallback: an empty list means no
+        # match, and the script restores the sidebar for an empty prefix.
+        body = suggestion_responses.get(request.GET.get("suggestion", ""))
+        return HttpResponse(body, content_type="application/json")
     
     
 class SearchAddPageView(View):
@@ -281,8 +388,9 @@ class SearchAddPageView(View):
             return HttpResponse("Error - bad category ID.")
         
         p = Page.objects.get_or_create(category = category, title = title, url = url)
-        pages = Page.objects.filter(category = category).order_by("-views")
-        return render(request, "rango/page_listing.html", {"pages": pages})
+        pages, next_cursor = category_pages(category.id)
+        return render(request, "rango/page_listing.html", {"pages": pages, "next_cursor": next_cursor,
+                                                           "category": category})
     
     
 '''
@@ -396,6 +504,24 @@ def user_logout(request):
     return redirect(reverse("rango:index"))
 '''
 
+def metrics_allowed(request):
+    # Staff can look from a browser; a scraper sends RANGO_METRICS_TOKEN as
+    # a bearer token.
+    if request.user.is_staff:
+        return True
+    token = getattr(settings, "RANGO_METRICS_TOKEN", None)
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    return bool(token) and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    # Publish this worker's latest numbers first, so they are included.
+    metrics.publish()
+    return HttpResponse(metrics.render_text(metrics.collect()),
+                        content_type="text/plain; version=0.0.4; charset=utf-8")
+
 @login_required
 def restricted(request):
     return render(request, "rango/restricted.html")
@@ -408,53 +534,55 @@ def get_server_side_cookie(request, cookie, default_val=None):
         val = default_val
     return val
 
+VISIT_INTERVAL = 24 * 60 * 60
+
 def visitor_cookie_handler(request):
-    # Get the number of visits to the site.
-    # If the cookie exists, the value returned is casted to an integer.
-    # If the cookie does not exists, the the default value of 1 is used.
-    visits = int(get_server_side_cookie(request, "visits", "1"))
-    
-    last_visit_cookie = get_server_side_cookie(request, "last_visit", str(datetime.now()))
-    last_visit_time = datetime.strptime(last_visit_cookie[:-7], "%Y-%m-%d %H:%M:%S")
+    # Visits are counted once per day. The session is only written on the
+    # first visit and when a day has passed since the last counted visit, so
+    # most requests leave it unmodified and the session backend doesn't have
+    # to save it. The last visit is stored as a Unix timestamp, which is
+    # compact enough for the signed cookie session backend too.
+    now = int(time.time())
+    visits = get_server_side_cookie(request, "visits")
+    last_visit = request.session.get("last_visit")
     
-    # If it's been more than a day since the last visit,
-    if (datetime.now() - last_visit_time).days > 0:
-        visits += 1
-        # update the last visit cookie now that we have updated the count.
-        request.session["last_visit"] = str(datetime.now())
-    else:
-        # set the last visit cookie.
-        request.session["last_visit"] = last_visit_cookie
-        
-    # Update/set the visits cookie
-    request.session["visits"] = visits
+    if isinstance(last_visit, str):
+        # Sessions from before timestamps were used hold str(datetime.now()).
+        try:
+            last_visit = int(datetime.strptime(last_visit[:19], "%Y-%m-%d %H:%M:%S").timestamp())
+        except ValueError:
+            last_visit = None
+        else:
+            request.session["last_visit"] = last_visit
     
-"""    
-def search(request):
-    result_list = []
-    query=""
+    if visits is None or last_visit is None:
+        request.session["visits"] = 1
+        request.session["last_visit"] = now
+    elif now - last_visit >= VISIT_INTERVAL:
+        request.session["visits"] = int(visits) + 1
+        request.session["last_visit"] = now
     
-    if request.method == "POST":
-        query = request.POST["query"].strip()
-        if query:
-            # Run the Bing search function to get the result list
-            result_list = run_query(query)
-            
-    return render(request, "rango/search.html", {"result_list":result_list, "query":query})
-"""
-
 def goto_url(request):
     if request.method == "GET":
         page_id = request.GET.get("page_id")
         
         try:
-            page = Page.objects.get(id = page_id)
-        except Page.DoesNotExist:
+            page_id = int(page_id)
+        except (TypeError, ValueError):
             return redirect(reverse("rango:index"))
         
-        page.views += 1
-        page.save()
-        return redirect(page.url)
+        # Only the URL is needed to redirect; the click itself is buffered
+        # and written to Page.views in batches by the click counter.
+        url = Page.objects.filter(id = page_id).values_list("url", flat=True).first()
+        if url is None:
+            return redirect(reverse("rango:index"))
+        
+        if events.event_log_enabled():
+            events.record_view(page_id)
+        else:
+            click_counter.record(page_id)
+        trending.record(page_id)
+        return redirect(url)
     
     return redirect(reverse("rango:index"))
     
@@ -462,11 +590,9 @@ def goto_url(request):
 def get_category_list(max_results=0, starts_with=""):
     category_list = []
     
+    # The prefix index answers from memory and ranks the matches by likes,
+    # so only the top max_results are ever materialised.
     if starts_with:
-        category_list = Category.objects.filter(name__istartswith=starts_with)
-        
-    if max_results>0:
-        if len(category_list) > max_results:
-            category_list = category_list[:max_results]
+        category_list = category_index.search(starts_with, limit=max_results or None)
             
-    return category_list
\ No newline at end of file
+    return category_list
@@ -12,17 +12,46 @@ $(document).ready(function() {
             })
     });
     
+    // The sidebar as rendered, shown again when the search box is cleared.
+    var originalCategories = $('#categories-listing').html();
+    
     $('#search-input').keyup(function() {
         var query;
         query = $(this).val();
         
-        $.get('/rango/suggest/',
+        if ($.trim(query) == '') {
+            $('#categories-listing').html(originalCategories);
+            return;
+        }
+        
+        $.getJSON('/rango/suggest/json/',
         {'suggestion': query},
         function(data) {
-            $('#categories-listing').html(data);
+            var list = $('<ul class="nav flex-column"></ul>');
+            
+            $.each(data.categories, function(i, category) {
+                var link = $('<a class="nav-link"></a>')
+                    .attr('href', '/rango/category/' + category[1] + '/')
+                    .text(category[0]);
+                list.append($('<li class="nav-item"></li>').append(link));
+            });
+            if (data.categories.length == 0) {
+                list.append('<li class="nav-item">There are no categories present.</li>');
+            }
+            $('#categories-listing').html(list);
         })
     });
     
+    // Listing items are added by earlier clicks, so delegate from the document.
+    $(document).on('click', '.rango-load-more', function() {
+        var item = $(this).closest('li');
+        
+        $.get($(this).attr('data-url'),
+            function(data) {
+                item.replaceWith(data);
+            })
+    });
+    
     $('.rango-add-page').click(function() {
         var categoryId = $(this).attr('data-categoryid');
         var title = $(this).attr('data-title');
@@ -0,0 +1,22 @@
+"""
+ASGI config for tango_with_django_project project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tango_with_django_project.settings')
+
+# Django 2.2 has no ASGI handler of its own. RangoASGIHandler runs the WSGI
+# application in a thread pool and the searches on the event loop.
+wsgi_application = get_wsgi_application()
+
+from rango.asgi import RangoASGIHandler  # noqa: E402 (needs the app registry)
+
+application = RangoASGIHandler(wsgi_application)
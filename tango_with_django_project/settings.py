@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "rango.middleware.MetricsMiddleware",
+    "rango.db_router.ReplicaPinningMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +77,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'tango_with_django_project.wsgi.application'
+ASGI_APPLICATION = 'tango_with_django_project.asgi.application'
 
 
 # Database
@@ -84,9 +87,55 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # A local stand-in for a read replica, kept in sync by
+    # "manage.py sync_replica --interval 1". Unused unless it is listed in
+    # RANGO_READ_REPLICAS.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+    },
+}
+
+# Production SQLite mode: with RANGO_SQLITE_PRODUCTION=1 in the environment,
+# every new connection is switched to WAL journaling with the pragmas in
+# rango.sqlite_tuning (or RANGO_SQLITE_PRAGMAS, if set), waits for locks
+# for the pragmas' busy_timeout instead of failing with "database is
+# locked", and connections are kept open between requests.
+# "manage.py bench_sqlite" measures the difference.
+RANGO_SQLITE_TUNING = bool(os.environ.get("RANGO_SQLITE_PRODUCTION"))
+if RANGO_SQLITE_TUNING:
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+
+# Reads are spread over these databases and writes go to "default". After
+# writing, a browser reads from "default" for RANGO_REPLICA_PIN_SECONDS, so
+# users always see their own changes despite replication lag.
+DATABASE_ROUTERS = ["rango.db_router.ReplicaRouter"]
+RANGO_READ_REPLICAS = []
+RANGO_REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # A cache shared by all worker processes, e.g. memcached:
+    #"shared": {
+    #    "BACKEND": "django.core.cache.backends.memcached.MemcachedCache",
+    #    "LOCATION": "127.0.0.1:11211",
+    #},
 }
 
+# The sidebar, the anonymous page cache and other version-keyed caches are
+# only invalidated in every worker when CACHES['default'] is shared by all of
+# them (e.g. memcached). With a per-process cache such as LocMemCache, their
+# entries are kept for at most this many seconds instead.
+# "manage.py check --deploy" warns about a per-process default cache.
+RANGO_LOCAL_CACHE_TIMEOUT = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -129,13 +178,39 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [STATIC_DIR, ]
 
+# The files the base template loads, bundled into one script and one
+# stylesheet when static files are collected with RangoStaticFilesStorage.
+RANGO_STATIC_BUNDLES = {
+    "css/rango.css": ["css/bootstrap.min.css", "css/dashboard.css"],
+    "js/rango.js": ["js/jquery-3.3.1.min.js", "js/rango-query.js", "js/rango-ajax.js",
+                    "js/bootstrap.bundle.min.js", "js/feather.min.js", "js/dashboard.js"],
+}
+
+# Production static files: run manage.py collectstatic with
+# RANGO_STATIC_PIPELINE=1 set to build the bundles, content-hashed names and
+# precompressed .gz/.br files in STATIC_ROOT, which Rango then serves itself
+# (unless the web server or a CDN does).
+if os.environ.get("RANGO_STATIC_PIPELINE"):
+    STATIC_ROOT = os.path.join(BASE_DIR, "static_root")
+    STATICFILES_STORAGE = "rango.staticfiles.RangoStaticFilesStorage"
+    RANGO_SERVE_STATIC = True
+
 # Media files
 
 MEDIA_ROOT = MEDIA_DIR
 MEDIA_URL = "/media/"
 
+# Uploads larger than this are streamed to a temporary file in chunks
+# instead of being held in memory, and moved into MEDIA_ROOT when saved.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
 #LOGIN_URL = "rango:login" obsolete with chapter 11
 
+# Sessions are stored in the database. Visit tracking writes to the session
+# at most once a day, so the signed cookie or cache backends work as well:
+#SESSION_ENGINE = "django.contrib.sessions.backends.signed_cookies"
+#SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+SESSION_ENGINE = "django.contrib.sessions.backends.db"
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_COOKIE_AGE = 3600
 
@@ -151,4 +226,120 @@ REGISTRATION_AUTO_LOGIN = True
 LOGIN_REDIRECT_URL = "rango:index"
 
 # The page users are directed to if they are not logged in.
-LOGIN_URL = "auth_login"
\ No newline at end of file
+LOGIN_URL = "auth_login"
+
+# Rango click counter
+
+# Clicks on outbound page links are buffered per worker and written to
+# Page.views once this many clicks have accumulated...
+RANGO_CLICK_FLUSH_SIZE = 100
+# ...or once this many seconds have passed since the last write.
+RANGO_CLICK_FLUSH_INTERVAL = 5.0
+# If True, the write happens in a background thread so the redirect is
+# never held up by the database, and a timer thread writes clicks that have
+# waited RANGO_CLICK_FLUSH_INTERVAL seconds even when no more arrive.
+RANGO_CLICK_FLUSH_BACKGROUND = True
+
+# Category suggestions are answered from an in-memory prefix index, which is
+# rebuilt from the database in the background after this many seconds.
+RANGO_SUGGEST_INDEX_MAX_AGE = 60
+# JSON suggestion responses for this many prefixes are kept for up to
+# RANGO_SUGGEST_CACHE_TTL seconds, or until the index changes.
+RANGO_SUGGEST_CACHE_SIZE = 4096
+RANGO_SUGGEST_CACHE_TTL = 5
+
+# Search
+
+# The backend run_query uses: BingSearchBackend searches the web,
+# LocalSearchBackend searches Rango's own pages and categories.
+RANGO_SEARCH_BACKEND = "rango.search_backends.BingSearchBackend"
+# LocalSearchBackend's index is rebuilt in the background after this many
+# seconds, picking up view counts and other workers' changes.
+RANGO_LOCAL_SEARCH_MAX_AGE = 300
+
+# Bing search: set BING_API_KEY to skip reading bing.key from disk.
+BING_SEARCH_URL = "https://api.cognitive.microsoft.com/bing/v7.0/search"
+# Seconds to wait for a connection and for a response.
+BING_CONNECT_TIMEOUT = 3.05
+BING_READ_TIMEOUT = 10
+# Failed searches are retried with exponential backoff.
+BING_MAX_RETRIES = 2
+BING_RETRY_BACKOFF = 0.3
+# Connections kept alive per worker, and per event loop for async searches.
+BING_POOL_SIZE = 10
+BING_ASYNC_POOL_SIZE = 100
+# After this many consecutive failures, searches return no results without
+# calling Bing for BING_CIRCUIT_RESET seconds.
+BING_CIRCUIT_FAILURES = 5
+BING_CIRCUIT_RESET = 30
+# Search results are cached per worker for RANGO_SEARCH_CACHE_TTL seconds,
+# keeping at most RANGO_SEARCH_CACHE_SIZE queries.
+RANGO_SEARCH_CACHE_SIZE = 1024
+RANGO_SEARCH_CACHE_TTL = 600
+# Name of a CACHES entry shared by all workers (e.g. "shared"), or None.
+RANGO_SEARCH_CACHE_ALIAS = None
+
+# Number of pages shown per batch in a category's page listing.
+RANGO_PAGE_LISTING_SIZE = 5
+# Number of profiles shown per page of the profile directory.
+RANGO_PROFILE_LISTING_SIZE = 50
+
+# Per-view request metrics are published to the cache every this many
+# seconds, and kept there for RANGO_METRICS_PUBLISH_TIMEOUT seconds.
+RANGO_METRICS_PUBLISH_INTERVAL = 10
+RANGO_METRICS_PUBLISH_TIMEOUT = 60 * 60
+
+# The metrics endpoint is open to staff, and to requests that send
+# "Authorization: Bearer <RANGO_METRICS_TOKEN>" when a token is set.
+RANGO_METRICS_TOKEN = os.environ.get("RANGO_METRICS_TOKEN")
+
+# Pages served to anonymous visitors are cached for at most this many
+# seconds; they are invalidated as soon as the data they show changes.
+RANGO_PAGE_CACHE_TIMEOUT = 60 * 5
+
+# Profile pictures are scaled to these sizes (square, in pixels) by a pool
+# of RANGO_THUMBNAIL_WORKERS threads after they have been uploaded. With
+# RANGO_THUMBNAIL_BACKGROUND off they are made before the request returns.
+RANGO_THUMBNAIL_SIZES = (30, 300)
+RANGO_THUMBNAIL_WORKERS = 2
+RANGO_THUMBNAIL_BACKGROUND = True
+
+# Media files are served by rango.media.serve_media. Set to "x-sendfile" or
+# "x-accel-redirect" to have the web server send the file; for nginx, map an
+# internal location at RANGO_MEDIA_ACCEL_PREFIX onto MEDIA_ROOT:
+#
+#   location /protected-media/ { internal; alias /path/to/media/; }
+RANGO_MEDIA_SENDFILE = None
+RANGO_MEDIA_ACCEL_PREFIX = "/protected-media/"
+# Browsers may cache media for this many seconds; files with content-hashed
+# names, such as thumbnails, are cached for a year.
+RANGO_MEDIA_MAX_AGE = 60 * 60
+
+# The home page's trending lists are recomputed from the click windows at
+# most once every this many seconds.
+RANGO_TRENDING_REFRESH = 1
+# Each worker publishes its most clicked pages to the cache every this many
+# seconds, from a timer thread (or, with RANGO_TRENDING_PUBLISH_BACKGROUND
+# off, from the next click), so the lists rank every worker's clicks when
+# CACHES['default'] is shared. Only each worker's top
+# RANGO_TRENDING_CANDIDATES pages per list are published, which keeps the
+# cached values small however many pages are clicked.
+RANGO_TRENDING_PUBLISH_INTERVAL = 5
+RANGO_TRENDING_PUBLISH_BACKGROUND = True
+RANGO_TRENDING_CANDIDATES = 200
+
+# With the click event log on, page views and likes are appended to the
+# ClickEvent table and added to the counts by "manage.py aggregate_events",
+# in batches of RANGO_EVENT_BATCH_SIZE events. Events younger than
+# RANGO_EVENT_AGGREGATION_LAG seconds are left for the next run.
+RANGO_CLICK_EVENT_LOG = False
+RANGO_EVENT_BATCH_SIZE = 5000
+RANGO_EVENT_AGGREGATION_LAG = 1
+
+# Each worker caches the categories looked up by slug, including unknown
+# slugs, keeping at most RANGO_SLUG_CACHE_SIZE for RANGO_SLUG_CACHE_TTL seconds
+# (RANGO_SLUG_CACHE_NEGATIVE_TTL for unknown slugs), or RANGO_LOCAL_CACHE_TIMEOUT
+# if CACHES['default'] isn't shared.
+RANGO_SLUG_CACHE_SIZE = 10000
+RANGO_SLUG_CACHE_TTL = 60
+RANGO_SLUG_CACHE_NEGATIVE_TTL = 10
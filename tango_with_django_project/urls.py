@@ -18,7 +18,8 @@ from django.urls import path
 from django.urls import include
 from rango import views
 from django.conf import settings
-from django.conf.urls.static import static
+from rango.media import serve_media
+from rango.staticfiles import serve_static
 from registration.backends.simple.views import RegistrationView
 from django.urls import reverse
 
@@ -35,4 +36,9 @@ urlpatterns = [
         path('admin/', admin.site.urls),
         path("accounts/register/", MyRegistrationView.as_view(), name="registration_register"),
         path("accounts/", include("registration.backends.simple.urls")),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+        # Uploaded files. Served in production too, see RANGO_MEDIA_SENDFILE.
+        path(settings.MEDIA_URL.lstrip("/") + "<path:path>", serve_media, name="media"),
+]
+
+if getattr(settings, "RANGO_SERVE_STATIC", False):
+    urlpatterns.append(path(settings.STATIC_URL.lstrip("/") + "<path:path>", serve_static, name="static"))